@@ -0,0 +1,77 @@
+"""
+archive_attendance.py
+
+Move old attendance records from `attendance_records` into the compressed
+per-(employee, month) `attendance_archive` collection.
+
+Usage:
+  python archive_attendance.py                       # archive months older than ARCHIVE_HORIZON_DAYS (730)
+  python archive_attendance.py --horizon-days 365
+  python archive_attendance.py --dry-run             # list the months that would be archived
+
+Only whole months are archived: everything before the first day of the month
+that contains (today - horizon). Each month is written to the archive first
+and then deleted from the hot collection in batches (--batch-size, --pause),
+so an interrupted run can simply be repeated; months that were already
+archived are merged. Reports, the monthly CSV and rollup rebuilds read the
+archive transparently. Schedule it off-peak, e.g. monthly from cron.
+"""
+import argparse
+import asyncio
+import time
+from datetime import date
+
+from attendance_system.models import AttendanceRecord, AttendanceArchive
+from attendance_system import archive, database
+from attendance_system.utils import day_start
+
+
+async def main(args):
+    db = await database.connect(minPoolSize=0)
+
+    cutoff = archive.archive_cutoff(date.today(), args.horizon_days)
+    records = AttendanceRecord.get_motor_collection()
+    oldest = await records.find_one({}, {"date": 1}, sort=[("date", 1)])
+    if oldest is None or oldest["date"] >= day_start(cutoff):
+        print(f"nothing to archive before {cutoff}")
+        database.close()
+        return
+
+    months = archive.months_between(oldest["date"].date(), cutoff)
+    months = [month for month in months if archive.month_bounds(month)[1] <= cutoff]
+    print(f"archiving records before {cutoff}: {months[0]} .. {months[-1]} ({len(months)} months)")
+
+    total_records = total_docs = 0
+    started = time.perf_counter()
+    for month in months:
+        month_start, next_month = archive.month_bounds(month)
+        if args.dry_run:
+            count = await records.count_documents({"date": {"$gte": day_start(month_start), "$lt": day_start(next_month)}})
+            print(f"  {month}: {count} records")
+            continue
+        result = await archive.archive_month(month, batch_size=args.batch_size, pause=args.pause)
+        total_records += result["records"]
+        total_docs += result["documents"]
+        print(f"  {month}: {result['records']} records -> {result['documents']} archive documents")
+        if result["skipped"]:
+            print(f"  {month}: {result['skipped']} records changed while archiving, left in attendance_records")
+
+    if not args.dry_run:
+        stats = await db.command("collStats", AttendanceArchive.get_settings().name)
+        print(f"archived {total_records} records into {total_docs} documents in {time.perf_counter() - started:.1f}s; "
+              f"archive size {stats.get('size', 0) / 1e6:.1f} MB, on disk {stats.get('storageSize', 0) / 1e6:.1f} MB")
+    database.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Archive old attendance records")
+    parser.add_argument("--horizon-days", type=int, default=archive.ARCHIVE_HORIZON_DAYS,
+                        help="keep at least this many days in attendance_records (default ARCHIVE_HORIZON_DAYS or 730)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.1, help="seconds to sleep between delete batches")
+    parser.add_argument("--dry-run", action="store_true")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
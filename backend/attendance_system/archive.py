@@ -0,0 +1,364 @@
+"""考勤冷存储
+
+超过 ARCHIVE_HORIZON_DAYS（默认 730 天）的考勤按整月从 attendance_records 搬到
+attendance_archive：每个 (员工, 月) 一条文档，记录按日期排序后各字段分列打包、
+zlib 压缩，一个月 20 来条记录压缩后只有几百字节，热集合只保留近期数据。
+
+列布局（小端，n = 记录数）：
+    日(uint8 * n) | 状态序号(uint8 * n) | 签到毫秒(int32 * n) | 签退毫秒(int32 * n) | 工时(float64 * n)
+签到/签退存当天零点起的毫秒数（BSON 时间本来就是毫秒精度），缺失用 _NONE_MS，工时缺失用 NaN。
+
+读取：
+- archived_records / merge_sorted     月度 CSV 这类按 (employee_id, date) 顺序的流式读取
+- employee_records                    某员工一段时间内的记录
+- records_on                          某一天的记录（只解出当天那一列，不解整月）
+- archived_days                       写路径检查某些天是否已归档（已归档的日期拒绝再写）
+读接口总是把热数据和归档一起查：归档之后同一天又写入的热记录优先。
+archived_records / records_on 只给报表和导出用，按 database.report_collection 的读偏好读。
+
+rollup 在归档时不变（计数本来就包含这些记录），rebuild_rollups 会连归档一起重建。
+"""
+import asyncio
+import logging
+import math
+import os
+import struct
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.errors import CollectionInvalid
+
+from attendance_system import database
+from attendance_system.enums import AttendanceStatus
+from attendance_system.models import AttendanceArchive, AttendanceRecord, Employee
+from attendance_system.utils import day_start
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "730"))
+
+STATUSES = list(AttendanceStatus)
+_STATUS_CODE = {status.value: code for code, status in enumerate(STATUSES)}
+_NONE_MS = -2 ** 31
+RECORD_FIELDS = {
+    "employee_id": 1, "date": 1, "check_in_time": 1, "check_out_time": 1,
+    "working_hours": 1, "status": 1, "notes": 1,
+}
+# 解码归档文档需要的字段
+ARCHIVE_FIELDS = {"employee_id": 1, "month": 1, "record_count": 1, "columns": 1, "notes": 1}
+
+
+def month_key(d: date) -> str:
+    return f"{d:%Y-%m}"
+
+
+def month_bounds(month: str):
+    """'2024-01' -> (2024-01-01, 2024-02-01)"""
+    year, mon = (int(part) for part in month.split("-"))
+    start = date(year, mon, 1)
+    return start, (date(year + 1, 1, 1) if mon == 12 else date(year, mon + 1, 1))
+
+
+def months_between(start: date, end: date) -> list:
+    """start..end（含）覆盖的月份"""
+    months = []
+    current = start.replace(day=1)
+    while current <= end:
+        months.append(month_key(current))
+        current = month_bounds(month_key(current))[1]
+    return months
+
+
+def archive_cutoff(today: date, horizon_days: int = ARCHIVE_HORIZON_DAYS) -> date:
+    """早于返回日期的记录可以归档；只归档整月"""
+    return (today - timedelta(days=horizon_days)).replace(day=1)
+
+
+def _millis(value: Optional[datetime], midnight: datetime) -> int:
+    if value is None:
+        return _NONE_MS
+    delta = value - midnight
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+
+def _from_millis(value: int, midnight: datetime) -> Optional[datetime]:
+    return None if value == _NONE_MS else midnight + timedelta(milliseconds=value)
+
+
+def encode_month(employee_id, month: str, records: list) -> dict:
+    """把一个员工一个月的原始记录编码成归档文档（同一天多条时以后面的为准）"""
+    by_day = {}
+    for record in records:
+        by_day[record["date"].day] = record
+    days = sorted(by_day)
+    rows = [by_day[day] for day in days]
+    n = len(rows)
+
+    statuses, check_ins, check_outs, hours = [], [], [], []
+    notes = {}
+    for record in rows:
+        midnight = day_start(record["date"].date())
+        statuses.append(_STATUS_CODE[record["status"]])
+        check_ins.append(_millis(record.get("check_in_time"), midnight))
+        check_outs.append(_millis(record.get("check_out_time"), midnight))
+        value = record.get("working_hours")
+        hours.append(math.nan if value is None else float(value))
+        if record.get("notes"):
+            notes[str(record["date"].day)] = record["notes"]
+
+    packed = b"".join([
+        bytes(days),
+        bytes(statuses),
+        struct.pack(f"<{n}i", *check_ins),
+        struct.pack(f"<{n}i", *check_outs),
+        struct.pack(f"<{n}d", *hours),
+    ])
+    return {
+        "employee_id": employee_id,
+        "month": month,
+        "record_count": n,
+        "columns": zlib.compress(packed, 6),
+        "notes": notes,
+        "archived_at": datetime.now(),
+    }
+
+
+def _columns(doc: dict):
+    n = doc["record_count"]
+    packed = zlib.decompress(doc["columns"])
+    offsets = (0, n, 2 * n, 6 * n, 10 * n)
+    return n, packed, offsets
+
+
+def _row(doc: dict, packed: bytes, offsets, n: int, i: int, month_start: date) -> dict:
+    day = packed[offsets[0] + i]
+    midnight = day_start(month_start.replace(day=day))
+    working_hours = struct.unpack_from("<d", packed, offsets[4] + 8 * i)[0]
+    return {
+        "employee_id": doc["employee_id"],
+        "date": midnight,
+        "check_in_time": _from_millis(struct.unpack_from("<i", packed, offsets[2] + 4 * i)[0], midnight),
+        "check_out_time": _from_millis(struct.unpack_from("<i", packed, offsets[3] + 4 * i)[0], midnight),
+        "working_hours": None if math.isnan(working_hours) else working_hours,
+        "status": STATUSES[packed[offsets[1] + i]].value,
+        "notes": doc.get("notes", {}).get(str(day)),
+    }
+
+
+def decode_month(doc: dict) -> list:
+    """归档文档 -> 原始记录形状的 dict 列表（date 为当天零点的 datetime，按日期排序）"""
+    n, packed, offsets = _columns(doc)
+    month_start = month_bounds(doc["month"])[0]
+    return [_row(doc, packed, offsets, n, i, month_start) for i in range(n)]
+
+
+def decode_day(doc: dict, d: date) -> Optional[dict]:
+    """只解出某一天的记录"""
+    n, packed, offsets = _columns(doc)
+    i = packed[:n].find(bytes([d.day]))
+    if i < 0:
+        return None
+    return _row(doc, packed, offsets, n, i, d.replace(day=1))
+
+
+async def archived_records(month: str, employee_ids: Optional[list] = None):
+    """按 (employee_id, date) 顺序逐条产出某月的归档记录"""
+    query = {"month": month}
+    if employee_ids is not None:
+        query["employee_id"] = {"$in": employee_ids}
+    cursor = database.report_collection(AttendanceArchive).find(query, ARCHIVE_FIELDS, sort=[("employee_id", 1)])
+    async for doc in cursor:
+        for record in decode_month(doc):
+            yield record
+
+
+async def merge_sorted(hot, archived):
+    """按 (employee_id, date) 合并两个有序流；同一员工同一天两边都有时以热数据为准"""
+    def key(doc):
+        return doc["employee_id"], doc["date"]
+
+    async def next_or_none(iterator):
+        try:
+            return await iterator.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    hot_iter, archived_iter = hot.__aiter__(), archived.__aiter__()
+    h = await next_or_none(hot_iter)
+    a = await next_or_none(archived_iter)
+    while h is not None or a is not None:
+        if a is None or (h is not None and key(h) <= key(a)):
+            if a is not None and key(h) == key(a):
+                a = await next_or_none(archived_iter)
+            yield h
+            h = await next_or_none(hot_iter)
+        else:
+            yield a
+            a = await next_or_none(archived_iter)
+
+
+async def employee_records(employee_id, start: date, end: date) -> list:
+    """某员工 start..end（含）的归档记录，原始 dict，按日期排序"""
+    docs = await AttendanceArchive.get_motor_collection().find(
+        {"employee_id": employee_id, "month": {"$in": months_between(start, end)}},
+        ARCHIVE_FIELDS,
+        sort=[("month", 1)],
+    ).to_list(length=None)
+    low, high = day_start(start), day_start(end)
+    return [record for doc in docs for record in decode_month(doc) if low <= record["date"] <= high]
+
+
+async def records_on(d: date, employee_ids: Optional[list] = None) -> list:
+    """某一天的归档记录"""
+    query = {"month": month_key(d)}
+    if employee_ids is not None:
+        query["employee_id"] = {"$in": employee_ids}
+    records = []
+    async for doc in database.report_collection(AttendanceArchive).find(query, ARCHIVE_FIELDS):
+        record = decode_day(doc, d)
+        if record is not None:
+            records.append(record)
+    return records
+
+
+async def archived_days(employee_ids, days) -> set:
+    """写路径用：这些员工在这些天里已归档的 (employee_id, date)，读主节点
+
+    已归档的日期不能再写热记录：读接口会以热记录为准盖掉归档，rollup 也会重复计数。
+    """
+    days = set(days)
+    if not employee_ids or not days:
+        return set()
+    found = set()
+    cursor = AttendanceArchive.get_motor_collection().find(
+        {"employee_id": {"$in": list(employee_ids)}, "month": {"$in": sorted({month_key(d) for d in days})}},
+        {"employee_id": 1, "month": 1, "record_count": 1, "columns": 1},
+    )
+    async for doc in cursor:
+        n, packed, _ = _columns(doc)
+        month_start = month_bounds(doc["month"])[0]
+        for day in packed[:n]:
+            d = month_start.replace(day=day)
+            if d in days:
+                found.add((doc["employee_id"], d))
+    return found
+
+
+async def ensure_collection(db):
+    """归档集合尽量用 zstd 块压缩（服务端不支持时退回默认压缩）"""
+    name = AttendanceArchive.get_settings().name
+    if name in await db.list_collection_names():
+        return
+    try:
+        await db.create_collection(name, storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}})
+    except CollectionInvalid:
+        pass
+    except Exception as e:
+        logger.warning(f"zstd block compression unavailable for {name}, using server default: {e}")
+        try:
+            await db.create_collection(name)
+        except CollectionInvalid:
+            pass
+
+
+async def archive_month(month: str, batch_size: int = 1000, pause: float = 0.0) -> dict:
+    """把某月的热记录并入归档，再按批删除；可以重复执行（已归档的月份会合并）
+
+    删除时带上归档时读到的全部字段作为条件：读完之后又被修改的记录不删，
+    并从归档里去掉那一天，留在热集合里等下次归档。
+    返回 {"records": 搬走的记录数, "documents": 写入的归档文档数, "skipped": 因中途修改留下的记录数}
+    """
+    from attendance_system import rollups
+
+    month_start, next_month = month_bounds(month)
+    records = AttendanceRecord.get_motor_collection()
+    archive = AttendanceArchive.get_motor_collection()
+    existing = set(await archive.distinct("employee_id", {"month": month}))
+
+    departments = {}
+    if existing:
+        async for emp in Employee.get_motor_collection().find({}, {"department": 1}):
+            departments[emp["_id"]] = emp.get("department")
+
+    moved = []  # 归档时读到的热记录快照
+    replaced = []  # 被热记录覆盖的旧归档记录，要从 rollup 里减掉
+    operations = []
+    documents = 0
+
+    async def flush_employee(employee_id, rows):
+        nonlocal documents
+        if employee_id in existing:
+            old = await archive.find_one({"employee_id": employee_id, "month": month}, ARCHIVE_FIELDS)
+            if old is not None:
+                old_rows = {row["date"]: row for row in decode_month(old)}
+                for row in rows:
+                    if row["date"] in old_rows:
+                        replaced.append(old_rows.pop(row["date"]))
+                rows = sorted(list(old_rows.values()) + rows, key=lambda row: row["date"])
+        operations.append(ReplaceOne(
+            {"employee_id": employee_id, "month": month},
+            encode_month(employee_id, month, rows),
+            upsert=True,
+        ))
+        documents += 1
+        if len(operations) >= batch_size:
+            await archive.bulk_write(operations, ordered=False)
+            operations.clear()
+
+    cursor = records.find(
+        {"date": {"$gte": day_start(month_start), "$lt": day_start(next_month)}},
+        RECORD_FIELDS,
+        sort=[("employee_id", 1), ("date", 1)],
+        batch_size=batch_size,
+    )
+    current, rows = None, []
+    async for doc in cursor:
+        if doc["employee_id"] != current and rows:
+            await flush_employee(current, rows)
+            rows = []
+        current = doc["employee_id"]
+        rows.append(doc)
+        moved.append(doc)
+    if rows:
+        await flush_employee(current, rows)
+    if operations:
+        await archive.bulk_write(operations, ordered=False)
+
+    if replaced:
+        await rollups.apply_changes(
+            (rollups.RawRecord(row), None, departments.get(row["employee_id"])) for row in replaced
+        )
+
+    # 归档写完再删热数据；中途失败重跑时会合并，不会丢记录
+    kept = []
+    for i in range(0, len(moved), batch_size):
+        batch = moved[i:i + batch_size]
+        result = await records.bulk_write(
+            [DeleteOne({name: doc.get(name) for name in ("_id", *RECORD_FIELDS)}) for doc in batch],
+            ordered=False,
+        )
+        if result.deleted_count < len(batch):
+            ids = [doc["_id"] for doc in batch]
+            remaining = set(await records.distinct("_id", {"_id": {"$in": ids}}))
+            kept += [doc for doc in batch if doc["_id"] in remaining]
+            vanished = len(batch) - len(remaining) - result.deleted_count
+            if vanished:
+                logger.warning(f"{vanished} records of {month} were deleted while archiving; run rebuild_rollups.py")
+        if pause:
+            await asyncio.sleep(pause)
+
+    # 被修改而没删掉的记录以热数据为准：从归档里去掉这些天，rollup 本来就只算热记录
+    kept_days = {}
+    for doc in kept:
+        kept_days.setdefault(doc["employee_id"], set()).add(doc["date"])
+    for employee_id, days in kept_days.items():
+        old = await archive.find_one({"employee_id": employee_id, "month": month}, ARCHIVE_FIELDS)
+        rows = [row for row in decode_month(old) if row["date"] not in days] if old else []
+        if rows:
+            await archive.replace_one({"employee_id": employee_id, "month": month}, encode_month(employee_id, month, rows))
+        else:
+            await archive.delete_one({"employee_id": employee_id, "month": month})
+
+    return {"records": len(moved) - len(kept), "documents": documents, "skipped": len(kept)}
@@ -0,0 +1,154 @@
+"""进程内员工目录缓存
+
+签到/签退按 employee_code 找员工、列表接口按 employee_id 附加姓名，每个请求都要读员工，
+而员工数据很少变化。这里按 ID 和 code 缓存 Employee 文档：
+- TTL 过期（EMPLOYEE_CACHE_TTL 秒，默认 60）
+- 超过 EMPLOYEE_CACHE_SIZE（默认 10000）条时按 LRU 淘汰
+- 员工写接口调用 invalidate() 立即失效
+缓存的是共享对象，调用方只读，不要修改后 save()。
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from beanie import PydanticObjectId
+from bson.errors import InvalidId
+
+from attendance_system.models import Employee, normalize_employee_code
+
+
+class EmployeeDirectoryCache:
+    def __init__(self, ttl_seconds: float = 60, max_size: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._by_id: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (过期时间, Employee)
+        self._code_to_id: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, employee_id: str) -> Optional[Employee]:
+        entry = self._by_id.get(employee_id)
+        if entry is None:
+            return None
+        expires_at, employee = entry
+        if expires_at < time.monotonic():
+            self._drop(employee_id)
+            return None
+        self._by_id.move_to_end(employee_id)
+        return employee
+
+    def _drop(self, employee_id: str):
+        entry = self._by_id.pop(employee_id, None)
+        if entry is not None:
+            code = entry[1].employee_code
+            if self._code_to_id.get(code) == employee_id:
+                del self._code_to_id[code]
+
+    def put(self, employee: Employee):
+        employee_id = str(employee.id)
+        self._drop(employee_id)
+        self._by_id[employee_id] = (time.monotonic() + self.ttl_seconds, employee)
+        self._code_to_id[employee.employee_code] = employee_id
+        while len(self._by_id) > self.max_size:
+            oldest = next(iter(self._by_id))
+            self._drop(oldest)
+            self.evictions += 1
+
+    async def get_by_id(self, employee_id) -> Optional[Employee]:
+        """按 ObjectId 取员工（包括已停用的），不存在返回 None"""
+        employee = self._lookup(str(employee_id))
+        if employee is not None:
+            self.hits += 1
+            return employee
+        self.misses += 1
+        try:
+            employee = await Employee.get(PydanticObjectId(employee_id))
+        except (InvalidId, TypeError):
+            return None
+        if employee is not None:
+            self.put(employee)
+        return employee
+
+    async def get_by_code(self, employee_code: str) -> Optional[Employee]:
+        """按员工编号取员工（包括已停用的），不存在返回 None"""
+        code = normalize_employee_code(employee_code)
+        employee_id = self._code_to_id.get(code)
+        employee = self._lookup(employee_id) if employee_id else None
+        if employee is not None:
+            self.hits += 1
+            return employee
+        self.misses += 1
+        employee = await Employee.find_one(Employee.employee_code == code)
+        if employee is not None:
+            self.put(employee)
+        return employee
+
+    async def get_many(self, employee_ids: Iterable) -> Dict[str, Employee]:
+        """批量取员工，返回 {str(id): Employee}；未命中的用一次 $in 查询补齐"""
+        result = {}
+        missing = []
+        for employee_id in {str(i) for i in employee_ids}:
+            employee = self._lookup(employee_id)
+            if employee is not None:
+                self.hits += 1
+                result[employee_id] = employee
+            else:
+                self.misses += 1
+                try:
+                    missing.append(PydanticObjectId(employee_id))
+                except (InvalidId, TypeError):
+                    continue
+        if missing:
+            for employee in await Employee.find({"_id": {"$in": missing}}).to_list():
+                self.put(employee)
+                result[str(employee.id)] = employee
+        return result
+
+    async def get_many_by_code(self, employee_codes: Iterable[str]) -> Dict[str, Employee]:
+        """批量按员工编号取员工，返回 {code: Employee}；未命中的用一次 $in 查询补齐"""
+        result = {}
+        missing = []
+        for code in {normalize_employee_code(c) for c in employee_codes}:
+            employee_id = self._code_to_id.get(code)
+            employee = self._lookup(employee_id) if employee_id else None
+            if employee is not None:
+                self.hits += 1
+                result[code] = employee
+            else:
+                self.misses += 1
+                missing.append(code)
+        if missing:
+            for employee in await Employee.find({"employee_code": {"$in": missing}}).to_list():
+                self.put(employee)
+                result[employee.employee_code] = employee
+        return result
+
+    def invalidate(self, employee_id=None, employee_code: Optional[str] = None):
+        if employee_code:
+            code_id = self._code_to_id.get(normalize_employee_code(employee_code))
+            if code_id:
+                self._drop(code_id)
+        if employee_id:
+            self._drop(str(employee_id))
+
+    def clear(self):
+        self._by_id.clear()
+        self._code_to_id.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._by_id),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+employee_directory = EmployeeDirectoryCache(
+    ttl_seconds=float(os.getenv("EMPLOYEE_CACHE_TTL", "60")),
+    max_size=int(os.getenv("EMPLOYEE_CACHE_SIZE", "10000")),
+)
@@ -1,6 +1,239 @@
-from typing import List
+"""MongoDB 连接（API 和脚本共用）
+
+- 连接池参数来自环境变量：
+    MONGO_MAX_POOL_SIZE       每个服务器的最大连接数（默认 100）
+    MONGO_MIN_POOL_SIZE       保持的最少连接数（默认 10，脚本传 minPoolSize=0）
+    MONGO_MAX_IDLE_TIME_MS    空闲连接多久后关闭（默认 300000；0 表示不关闭）
+    MONGO_COMPRESSORS         线路压缩，逗号分隔，例如 zstd,zlib（默认不压缩）
+- connect() 建客户端、ping、初始化 Beanie；API 启动时再预热 MONGO_MIN_POOL_SIZE 个连接，
+  上班高峰的第一波请求不用等建连
+- close() 关闭客户端（API 由 main.py 的 lifespan 在退出时调用）
+- pool_stats 通过 pymongo 的连接池事件统计连接数、使用中的连接和取连接的等待时间，
+  /api/health 和 /api/metrics 会输出
+- 读路由：客户端默认读偏好固定为 primary（URL 里的 readPreference 不生效），签到、签退、
+  请假审批这些先读后写的接口都在主节点上读；报表和导出改用 report_collection(Model)，按
+    REPORT_READ_PREFERENCE          primary / primaryPreferred / secondary / secondaryPreferred / nearest
+                                    （默认 primary，即不分流）
+    REPORT_MAX_STALENESS_SECONDS    从节点最多落后多少秒仍可读（默认不限；MongoDB 要求至少 90）。
+                                    不设时从节点的延迟没有上界，报表不缓存
+  路由到从节点。单机 mongod 忽略读偏好，所以不接副本集时配置了也无妨
+"""
+import asyncio
+import logging
+import os
+import threading
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from beanie import init_beanie
+from pymongo import monitoring
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+from attendance_system.models import Employee, AttendanceRecord, LeaveRequest, AttendanceRollup, AttendanceArchive
+
+logger = logging.getLogger(__name__)
+
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/attendance_db")
+MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+COMPRESSORS = [name.strip() for name in os.getenv("MONGO_COMPRESSORS", "").split(",") if name.strip()]
+REPORT_READ_PREFERENCE = os.getenv("REPORT_READ_PREFERENCE", "primary")
+REPORT_MAX_STALENESS_SECONDS = int(os.getenv("REPORT_MAX_STALENESS_SECONDS", "-1"))
+HEARTBEAT_FREQUENCY_MS = 10000  # 服务器心跳间隔（pymongo 默认值），从节点延迟按它估算
+
+DOCUMENT_MODELS = [Employee, AttendanceRecord, LeaveRequest, AttendanceRollup, AttendanceArchive]
+
+client: Optional[AsyncIOMotorClient] = None
+db = None
 
 # Auto-increment IDs
 next_employee_id = 1
 next_attendance_id = 1
 next_leave_id = 1
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """连接池事件计数（回调在 motor 的线程池里，带锁）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.created = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_seconds_sum = 0.0
+        self.wait_seconds_max = 0.0
+        self.clears = 0
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+            self.created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_checked_out(self, event):
+        # pymongo 4.7+ 的事件带取连接耗时（包括等待空闲连接和新建连接）
+        duration = getattr(event, "duration", None) or 0.0
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_seconds_sum += duration
+            self.wait_seconds_max = max(self.wait_seconds_max, duration)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.clears += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "max_pool_size": MAX_POOL_SIZE,
+                "min_pool_size": MIN_POOL_SIZE,
+                "open": self.open,
+                "in_use": self.in_use,
+                # 单节点时即连接池占用率；副本集上是所有节点合计
+                "utilization": round(self.in_use / MAX_POOL_SIZE, 4) if MAX_POOL_SIZE else 0.0,
+                "created": self.created,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "avg_wait_ms": round(self.wait_seconds_sum / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.wait_seconds_max * 1000, 3),
+                "clears": self.clears,
+            }
+
+
+pool_stats = PoolStats()
+
+_READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def read_preference(mode: str, max_staleness: int = -1):
+    """按名字构造读偏好；primary 不能带 max staleness，直接忽略"""
+    if mode not in _READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {mode!r}, expected one of {', '.join(_READ_PREFERENCES)}")
+    if mode == "primary":
+        return Primary()
+    if 0 <= max_staleness < 90:
+        raise ValueError("REPORT_MAX_STALENESS_SECONDS must be at least 90 (or -1 for no limit)")
+    return _READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+
+report_read_preference = read_preference(REPORT_READ_PREFERENCE, REPORT_MAX_STALENESS_SECONDS)
+
+
+def report_collection(model):
+    """报表/导出用的集合：按 REPORT_READ_PREFERENCE 路由读请求，写接口不要用它"""
+    return model.get_motor_collection().with_options(read_preference=report_read_preference)
+
+
+def report_read_lag_seconds() -> Optional[float]:
+    """报表读到的数据最多可能比主节点旧多少秒（供报表缓存判断结果是否可以缓存）
+
+    在主节点上读为 0；从节点上为 max staleness 加一个心跳间隔（驱动按心跳估算从节点延迟）；
+    没设 max staleness 时从节点可以落后任意久，返回 None。
+    """
+    if isinstance(report_read_preference, Primary):
+        return 0.0
+    if REPORT_MAX_STALENESS_SECONDS < 0:
+        return None
+    return float(REPORT_MAX_STALENESS_SECONDS + HEARTBEAT_FREQUENCY_MS / 1000)
+
+
+def database_name(url: str = MONGODB_URL) -> str:
+    return url.split("/")[-1].split("?")[0] or "attendance_db"
+
+
+def pool_options(**overrides) -> dict:
+    options = {
+        "maxPoolSize": MAX_POOL_SIZE,
+        "minPoolSize": MIN_POOL_SIZE,
+        "maxIdleTimeMS": MAX_IDLE_TIME_MS or None,
+        "serverSelectionTimeoutMS": 5000,
+        "heartbeatFrequencyMS": HEARTBEAT_FREQUENCY_MS,
+        # 默认在主节点读，报表的分流只通过 report_collection()
+        "readPreference": "primary",
+    }
+    if COMPRESSORS:
+        options["compressors"] = COMPRESSORS
+    options.update(overrides)
+    return options
+
+
+def create_client(url: str = MONGODB_URL, event_listeners=(), **overrides) -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(url, event_listeners=[pool_stats, *event_listeners], **pool_options(**overrides))
+
+
+async def init_models(database=None):
+    """建归档集合并初始化 Beanie（创建索引）"""
+    from attendance_system import archive
+
+    database = database if database is not None else db
+    await archive.ensure_collection(database)
+    await init_beanie(database=database, document_models=DOCUMENT_MODELS)
+
+
+async def warm_up(connections: int = MIN_POOL_SIZE):
+    """并发 ping，让连接池先建好 connections 个连接"""
+    if connections <= 0:
+        return
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
+
+
+async def connect(url: str = MONGODB_URL, event_listeners=(), init: bool = True, **overrides):
+    """建立全局客户端并 ping；init=True 时同时初始化 Beanie。返回数据库对象"""
+    global client, db
+    client = create_client(url, event_listeners, **overrides)
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout=5.0)
+    except asyncio.TimeoutError:
+        close()
+        raise RuntimeError("MongoDB connection timeout")
+    except Exception:
+        close()
+        raise
+    db = client[database_name(url)]
+    if init:
+        await init_models(db)
+    return db
+
+
+def close():
+    global client, db
+    if client is not None:
+        client.close()
+    client = None
+    db = None
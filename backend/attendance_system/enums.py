@@ -24,3 +24,17 @@ class LeaveType(str, Enum):
     PERSONAL_LEAVE = "Personal Leave"
     UNPAID_LEAVE = "Unpaid Leave"
     MATERNITY_LEAVE = "Maternity Leave"
+
+
+class PunchDirection(str, Enum):
+    IN = "in"
+    OUT = "out"
+
+
+class PunchOutcome(str, Enum):
+    CREATED = "created"
+    CHECKED_OUT = "checked_out"
+    DUPLICATE = "duplicate"
+    UNKNOWN_EMPLOYEE = "unknown_employee"
+    NO_CHECK_IN = "no_check_in"
+    WEEKEND = "weekend"
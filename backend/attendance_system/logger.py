@@ -1,17 +1,32 @@
+import atexit
+import copy
+import json
 import logging
 import logging.config
+import logging.handlers
+import os
+import queue
+
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_FILE = os.path.join(LOG_DIR, "attendance_api.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text / json（JSON Lines）
+
+DEFAULT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 LOGGING_CONFIG = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
         "default": {
-            "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-            "datefmt": "%Y-%m-%d %H:%M:%S"
+            "format": DEFAULT_FORMAT,
+            "datefmt": DATE_FORMAT
         },
         "access": {
             "format": "[%(asctime)s] %(client_addr)s - %(method)s %(path)s - %(status_code)s - %(duration)sms",
-            "datefmt": "%Y-%m-%d %H:%M:%S"
+            "datefmt": DATE_FORMAT
         }
     },
     "handlers": {
@@ -19,20 +34,9 @@ LOGGING_CONFIG = {
             "class": "logging.StreamHandler",
             "formatter": "default",
             "level": "INFO"
-        },
-        "file": {
-            "class": "logging.FileHandler",
-            "filename": "logs/attendance_api.log",
-            "formatter": "default",
-            "level": "DEBUG"
         }
     },
     "loggers": {
-        "attendance_system": {
-            "handlers": ["console", "file"],
-            "level": "DEBUG",
-            "propagate": False
-        },
         "uvicorn": {
             "handlers": ["console"],
             "level": "INFO"
@@ -40,16 +44,112 @@ LOGGING_CONFIG = {
     }
 }
 
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条日志一行 JSON；log_event 的结构化字段展开到顶层"""
+
+    def format(self, record):
+        payload = {
+            "time": self.formatTime(record, self.datefmt),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            payload.update(fields)
+        # 经过 _QueueHandler 的记录只剩 exc_text（见下）
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+        if record.stack_info:
+            payload["stack_info"] = record.stack_info
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """入队前只合并消息参数，异常堆栈单独放进 exc_text
+
+    父类 prepare 会用自己的格式把堆栈拼进 msg 再清掉 exc_info，JSON 格式就丢了 exc_info 字段。
+    traceback 对象不能跨线程保留，所以这里先格式化成文本；文本和 JSON 格式化器都会输出 exc_text。
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.message = record.msg
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+_listener = None
+
+
+def stop_logging():
+    """停止后台写日志线程并刷出队列里剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
 def setup_logging():
-    """初始化日志配置"""
-    try:
-        logging.config.dictConfig(LOGGING_CONFIG)
-    except Exception as e:
-        # 备用方案
-        import os
-        os.makedirs("logs", exist_ok=True)
-        logging.config.dictConfig(LOGGING_CONFIG)
+    """初始化日志配置
+
+    attendance_system 的日志只放进内存队列（QueueHandler），由后台线程（QueueListener）
+    写控制台和按大小轮转的文件，请求处理中不会因为写盘阻塞事件循环。重复调用无副作用。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    logging.config.dictConfig(LOGGING_CONFIG)
+
+    if LOG_FORMAT == "json":
+        formatter = JsonLinesFormatter(datefmt=DATE_FORMAT)
+    else:
+        formatter = logging.Formatter(DEFAULT_FORMAT, datefmt=DATE_FORMAT)
+
+    console = logging.StreamHandler()
+    console.setLevel(logging.INFO)
+    console.setFormatter(formatter)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(-1)
+    _listener = logging.handlers.QueueListener(log_queue, console, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    app_logger = logging.getLogger("attendance_system")
+    for handler in list(app_logger.handlers):
+        app_logger.removeHandler(handler)
+    app_logger.addHandler(_QueueHandler(log_queue))
+    app_logger.setLevel(logging.DEBUG)
+    app_logger.propagate = False
+
+
+def log_event(event: str, **fields):
+    """记录结构化业务事件（签到、签退、审批等）
+
+    文本格式输出 `event key=value ...`，JSON 格式下 event 和字段作为独立的键。
+    """
+    event_logger.info(
+        "%s %s", event, " ".join(f"{key}={value}" for key, value in fields.items()),
+        extra={"fields": dict(fields, event=event)},
+    )
+
 
 # 初始化
 setup_logging()
 logger = logging.getLogger("attendance_system")
+event_logger = logging.getLogger("attendance_system.events")
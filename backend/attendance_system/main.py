@@ -1,17 +1,20 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import FileResponse
+from starlette.responses import FileResponse, PlainTextResponse
 from httpx import AsyncClient
 import os
-import time
 import logging
 from attendance_system.logger import setup_logging
+from attendance_system.cache import employee_directory
+from attendance_system.report_cache import report_cache
+from attendance_system.middleware import APIHeadersMiddleware, DEFAULT_CSP
+from attendance_system.metrics import registry as metrics_registry, mongo_command_metrics
+from attendance_system import database, profiler
 
-from motor.motor_asyncio import AsyncIOMotorClient
-from beanie import init_beanie
-from attendance_system.models import Employee, AttendanceRecord, LeaveRequest
+from pymongo.errors import DuplicateKeyError
 
 
 from attendance_system.routes.attendance import router as attendance_router
@@ -23,92 +26,68 @@ from attendance_system.routes.leave import router as leave_router
 setup_logging()
 logger = logging.getLogger(__name__)
 
-class CSPMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        response.headers["Content-Security-Policy"] = "default-src *; script-src * 'unsafe-inline' 'unsafe-eval'; style-src * 'unsafe-inline'; img-src * data: blob:"
-        return response
-
-
-class RequestTimingMiddleware(BaseHTTPMiddleware):
-    """记录每个请求的处理时间"""
-    async def dispatch(self, request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-
-        response.headers["X-Process-Time"] = str(process_time)
-        
-        # 记录日志
-        logger.info(
-            f"{request.method} {request.url.path} | "
-            f"Status: {response.status_code} | "
-            f"Process Time: {process_time:.4f}s"
-        )
-        
-        return response
-
-
-class VersionHeaderMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        response.headers["X-Attendance-API-Version"] = "1.0.0"
-        response.headers["X-API-Server"] = "FastAPI"
-        return response
-
-
-app = FastAPI(
-    title="Staff Attendance Record System",
-    description="Staff Attendance Record Management API",
-    version="1.0.0",
-)
-
-MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/attendance_db")
-
-_mongo_client: AsyncIOMotorClient = None
-_mongo_db = None
-
 logger.info("Using MongoDB URL from env or default (not showing credentials)")
 
-@app.on_event("startup")
+
 async def startup_db():
-    global _mongo_client, _mongo_db
     try:
-        _mongo_client = AsyncIOMotorClient(MONGODB_URL, serverSelectionTimeoutMS=5000)
-        # ping 测试连接
-        import asyncio
-        await asyncio.wait_for(_mongo_client.admin.command('ping'), timeout=5.0)
+        await database.connect(
+            event_listeners=[mongo_command_metrics, profiler.query_profiler_listener],
+            init=False,
+        )
+        profiler.set_client(database.client)
         logger.info("Connected to MongoDB successfully!")
         print("Connected to MongoDB successfully!")
-    except asyncio.TimeoutError:
-        logger.error("MongoDB connection timeout - check if MongoDB is running on the configured URL")
-        raise RuntimeError("MongoDB connection timeout")
     except Exception as e:
         logger.error(f"MongoDB connection failed: {e}")
         print(f"MongoDB connection failed: {e}")
         raise
-    
+
     try:
-        # 解析数据库名
-        db_name = MONGODB_URL.split("/")[-1].split("?")[0]
-        if not db_name:
-            db_name = "attendance_db"
-        _mongo_db = _mongo_client[db_name]
-        await init_beanie(
-            database=_mongo_db,
-            document_models=[Employee, AttendanceRecord, LeaveRequest]
-        )
+        await database.init_models()
         logger.info("Beanie initialized successfully!")
         print("Beanie initialized successfully!")
+    except DuplicateKeyError as e:
+        # 唯一索引创建失败：库里还有重复数据
+        logger.error(f"Index creation failed, run `python dedupe_attendance.py` first: {e}")
+        raise
     except Exception as e:
         logger.error(f"Beanie initialization failed: {e}")
         print(f"Beanie initialization failed: {e}")
         raise
 
-# 添加中间件
-app.add_middleware(VersionHeaderMiddleware)
-app.add_middleware(RequestTimingMiddleware)
-# app.add_middleware(CSPMiddleware)
+    # 预热连接池，上班高峰的第一波请求不用再建连
+    await database.warm_up(database.MIN_POOL_SIZE)
+    logger.info(f"MongoDB pool warmed up: {database.pool_stats.snapshot()['open']} connections open")
+
+
+def shutdown_db():
+    database.close()
+    logger.info("MongoDB client closed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup_db()
+    try:
+        yield
+    finally:
+        shutdown_db()
+
+
+app = FastAPI(
+    title="Staff Attendance Record System",
+    description="Staff Attendance Record Management API",
+    version="1.0.0",
+    lifespan=lifespan,
+)
+
+# 添加中间件（纯 ASGI：版本头、X-Process-Time、请求日志；ENABLE_CSP=1 时附加 CSP 头）
+app.add_middleware(
+    APIHeadersMiddleware,
+    version=app.version,
+    csp=DEFAULT_CSP if os.getenv("ENABLE_CSP") == "1" else None,
+)
 
 # 配置 CORS 中间件
 app.add_middleware(
@@ -136,7 +115,17 @@ app.include_router(leave_router)
 @app.get("/api/health")
 async def health_check():
     """健康检查端点"""
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "employee_cache": employee_directory.stats(),
+        "report_cache": report_cache.stats(),
+        "mongo_pool": database.pool_stats.snapshot(),
+    }
+
+@app.get("/api/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 文本格式的指标"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # 挂载静态文件
 if os.path.exists(frontend_build_path):
@@ -0,0 +1,257 @@
+"""进程内指标，以 Prometheus 文本格式从 /api/metrics 暴露
+
+- HTTP：按路由模板/状态码的请求数、延迟直方图、进行中请求数（APIHeadersMiddleware 采集）
+- MongoDB：按命令/集合的次数和耗时（MongoCommandMetrics，注册在 motor 客户端上）
+- 缓存：员工目录缓存和报表缓存的命中/未命中、淘汰、大小（渲染时读取）
+- 连接池：打开/使用中的连接、取连接次数和等待时间（database.pool_stats，渲染时读取）
+
+pymongo 的监听器在 motor 的线程池里回调，所以各指标都带锁。
+"""
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from pymongo import monitoring
+
+from attendance_system.cache import employee_directory
+from attendance_system.database import pool_stats
+from attendance_system.report_cache import report_cache
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [各桶计数..., sum, count]
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        lines = []
+        for labels, series in items:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += series[i]
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[_Metric]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[_Metric]]):
+        """collector 在每次渲染时调用，返回临时生成的指标（用于缓存命中率这类现成的统计）"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests_total = registry.register(Counter(
+    "attendance_http_requests_total", "HTTP requests by route template and status code.",
+    ("method", "route", "status"),
+))
+http_request_duration_seconds = registry.register(Histogram(
+    "attendance_http_request_duration_seconds", "HTTP request latency in seconds.",
+    ("method", "route"),
+))
+http_requests_in_flight = registry.register(Gauge(
+    "attendance_http_requests_in_flight", "HTTP requests currently being processed.",
+    ("method",),
+))
+mongo_commands_total = registry.register(Counter(
+    "attendance_mongodb_commands_total", "MongoDB commands by command name, collection and outcome.",
+    ("command", "collection", "outcome"),
+))
+mongo_command_duration_seconds = registry.register(Histogram(
+    "attendance_mongodb_command_duration_seconds", "MongoDB command duration in seconds.",
+    ("command", "collection"),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+))
+
+
+def route_label(scope) -> str:
+    """用路由模板（如 /attendance/{attendance_id}）做标签，避免路径参数撑爆基数"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "__unmatched__"
+
+
+def command_collection(command_name: str, command) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    target = command.get(command_name)
+    return target if isinstance(target, str) else ""
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """统计每个 MongoDB 命令的次数和耗时"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[tuple, str] = {}
+
+    def started(self, event):
+        collection = command_collection(event.command_name, event.command)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, outcome: str):
+        with self._lock:
+            collection = self._pending.pop((event.connection_id, event.request_id), "")
+        mongo_commands_total.inc(event.command_name, collection, outcome)
+        mongo_command_duration_seconds.observe(event.duration_micros / 1e6, event.command_name, collection)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+def _cache_metrics():
+    stats = employee_directory.stats()
+    lookups = Counter("attendance_employee_cache_lookups_total", "Employee directory cache lookups by result.", ("result",))
+    lookups.inc("hit", amount=stats["hits"])
+    lookups.inc("miss", amount=stats["misses"])
+    evictions = Counter("attendance_employee_cache_evictions_total", "Employee directory cache LRU evictions.")
+    evictions.inc(amount=stats["evictions"])
+    size = Gauge("attendance_employee_cache_size", "Employees currently cached.")
+    size.set(stats["size"])
+    hit_rate = Gauge("attendance_employee_cache_hit_ratio", "Employee directory cache hit ratio since start.")
+    hit_rate.set(stats["hit_rate"])
+    return [lookups, evictions, size, hit_rate]
+
+
+registry.add_collector(_cache_metrics)
+
+
+def _report_cache_metrics():
+    stats = report_cache.stats()
+    lookups = Counter("attendance_report_cache_lookups_total", "Report cache lookups by result.", ("result",))
+    lookups.inc("hit", amount=stats["hits"])
+    lookups.inc("miss", amount=stats["misses"])
+    not_modified = Counter("attendance_report_cache_not_modified_total", "Report responses answered with 304 Not Modified.")
+    not_modified.inc(amount=stats["not_modified"])
+    evictions = Counter("attendance_report_cache_evictions_total", "Report cache LRU evictions.")
+    evictions.inc(amount=stats["evictions"])
+    size = Gauge("attendance_report_cache_size", "Reports currently cached.")
+    size.set(stats["size"])
+    size_bytes = Gauge("attendance_report_cache_bytes", "Serialized bytes held by the report cache.")
+    size_bytes.set(stats["bytes"])
+    hit_rate = Gauge("attendance_report_cache_hit_ratio", "Report cache hit ratio since start.")
+    hit_rate.set(stats["hit_rate"])
+    return [lookups, not_modified, evictions, size, size_bytes, hit_rate]
+
+
+registry.add_collector(_report_cache_metrics)
+
+
+def _pool_metrics():
+    stats = pool_stats.snapshot()
+    open_connections = Gauge("attendance_mongo_pool_connections", "Open MongoDB pool connections by state.", ("state",))
+    open_connections.set(stats["open"], "open")
+    open_connections.set(stats["in_use"], "in_use")
+    max_size = Gauge("attendance_mongo_pool_max_size", "Configured maxPoolSize per server.")
+    max_size.set(stats["max_pool_size"])
+    checkouts = Counter("attendance_mongo_pool_checkouts_total", "MongoDB pool connection checkouts by result.", ("result",))
+    checkouts.inc("ok", amount=stats["checkouts"])
+    checkouts.inc("failed", amount=stats["checkout_failures"])
+    wait = Counter("attendance_mongo_pool_checkout_wait_seconds_total", "Total time spent checking out pool connections.")
+    wait.inc(amount=pool_stats.wait_seconds_sum)
+    return [open_connections, max_size, checkouts, wait]
+
+
+registry.add_collector(_pool_metrics)
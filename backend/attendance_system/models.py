@@ -1,13 +1,26 @@
 from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
-from beanie import Document, Indexed, PydanticObjectId
+from beanie import Document, PydanticObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from datetime import date, datetime
-from typing import Optional
-from attendance_system.enums import Department, AttendanceStatus, LeaveType
+from typing import Dict, List, Optional
+from attendance_system.enums import Department, AttendanceStatus, LeaveType, PunchDirection, PunchOutcome
 import re
 
+EMPLOYEE_CODE_PATTERN = re.compile(r'^EMP(\d{3,6})$')
+
+
+def normalize_employee_code(code: str) -> str:
+    """员工编号的规范写法：转大写，数字部分去掉多余的前导零、至少 3 位（EMP0001 -> EMP001）
+
+    保存和查找都用它，EMP001 和 EMP0001 是同一个员工；不符合格式的只转大写，查找时自然查不到。
+    """
+    code = code.strip().upper()
+    match = EMPLOYEE_CODE_PATTERN.match(code)
+    return f"EMP{int(match.group(1)):03d}" if match else code
+
 # Employee 模型
 class EmployeeBase(BaseModel):
-    employee_code: str = Field(..., max_length=6)
+    employee_code: str = Field(..., max_length=9)
     full_name: str = Field(..., max_length=100)
     email: EmailStr
     department: Department
@@ -17,9 +30,9 @@ class EmployeeBase(BaseModel):
     @field_validator('employee_code')
     @classmethod
     def validate_code(cls, v: str):
-        if not re.match(r'^EMP\d{3}$', v):
-            raise ValueError('Employee code must be in format EMP001')
-        return v.upper()
+        if not EMPLOYEE_CODE_PATTERN.match(v):
+            raise ValueError('Employee code must be EMP followed by 3 to 6 digits (EMP001-EMP999999)')
+        return normalize_employee_code(v)
     
     class Settings:
         name = "employees"
@@ -33,9 +46,13 @@ class Employee(EmployeeBase, Document):
 
     class Settings:
         name = "employees"
+        indexes = [
+            IndexModel([("employee_code", ASCENDING)], name="employee_code_unique", unique=True),
+            IndexModel([("department", ASCENDING), ("is_deactivated", ASCENDING)], name="department_active"),
+        ]
 
 class EmployeeUpdate(BaseModel):
-    employee_code: Optional[str] = Field(None, max_length=6)
+    employee_code: Optional[str] = Field(None, max_length=9)
     full_name: Optional[str] = Field(None, max_length=100)
     email: Optional[EmailStr] = None
     department: Optional[Department] = None
@@ -46,15 +63,15 @@ class EmployeeUpdate(BaseModel):
     @classmethod
     def validate_code(cls, v: Optional[str]):
         if v is not None:
-            if not re.match(r'^EMP\d{3}$', v):
-                raise ValueError('Employee code must be in format EMP001')
-            return v.upper()
+            if not EMPLOYEE_CODE_PATTERN.match(v):
+                raise ValueError('Employee code must be EMP followed by 3 to 6 digits (EMP001-EMP999999)')
+            return normalize_employee_code(v)
         return v
 
 # AttendanceRecord 模型
 class AttendanceRecord(Document):
     employee_id: PydanticObjectId
-    date: Indexed(date)  # type: ignore
+    date: date
     check_in_time: Optional[datetime] = None
     check_out_time: Optional[datetime] = None
     status: AttendanceStatus = AttendanceStatus.PRESENT
@@ -63,6 +80,13 @@ class AttendanceRecord(Document):
 
     class Settings:
         name = "attendance_records"
+        indexes = [
+            # 每个员工每天只有一条记录；签到/签退/缺勤/请假都按 (employee_id, date) 查找
+            IndexModel([("employee_id", ASCENDING), ("date", ASCENDING)], name="employee_date_unique", unique=True),
+            IndexModel([("date", ASCENDING), ("status", ASCENDING)], name="date_status"),
+            # 列表分页的稳定排序 (date, _id)
+            IndexModel([("date", ASCENDING), ("_id", ASCENDING)], name="date_id"),
+        ]
 
 class AttendanceRecordWithEmployee(BaseModel):
     id: str
@@ -77,6 +101,84 @@ class AttendanceRecordWithEmployee(BaseModel):
     notes: Optional[str] = None
 
 
+# 只读投影：只取响应需要的字段
+class EmployeeBrief(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    employee_code: str
+    full_name: str
+
+    class Settings:
+        projection = {"_id": 1, "employee_code": 1, "full_name": 1}
+
+
+class AttendanceStatusView(BaseModel):
+    employee_id: PydanticObjectId
+    status: AttendanceStatus
+    check_in_time: Optional[datetime] = None
+    check_out_time: Optional[datetime] = None
+
+    class Settings:
+        projection = {"_id": 0, "employee_id": 1, "status": 1, "check_in_time": 1, "check_out_time": 1}
+
+
+class AttendancePunchView(BaseModel):
+    """批量打卡需要的记录字段（不含 notes），签退后按字段 $set 回写"""
+    id: PydanticObjectId = Field(alias="_id")
+    employee_id: PydanticObjectId
+    date: date
+    check_in_time: Optional[datetime] = None
+    check_out_time: Optional[datetime] = None
+    status: AttendanceStatus
+    working_hours: Optional[float] = None
+
+    class Settings:
+        projection = {
+            "_id": 1, "employee_id": 1, "date": 1, "check_in_time": 1,
+            "check_out_time": 1, "status": 1, "working_hours": 1,
+        }
+
+
+# 预聚合的考勤计数（见 attendance_system/rollups.py）
+class AttendanceRollup(Document):
+    key: str  # employee_month:<employee_id>:2026-01
+    scope: str
+    month: Optional[str] = None
+    employee_id: Optional[PydanticObjectId] = None
+    records: int = 0
+    present: int = 0
+    late: int = 0
+    half_day: int = 0
+    absent: int = 0
+    on_leave: int = 0
+    on_duty: int = 0
+    total_hours: float = 0.0
+    check_in_count: int = 0
+    check_in_seconds_sum: float = 0.0
+
+    class Settings:
+        name = "attendance_rollups"
+        indexes = [
+            IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+        ]
+
+
+# 考勤冷存储：一个员工一个月一条，各列打包后 zlib 压缩（编码见 archive.py）
+class AttendanceArchive(Document):
+    employee_id: PydanticObjectId
+    month: str  # 2024-01
+    record_count: int
+    columns: bytes
+    notes: Dict[str, str] = Field(default_factory=dict)  # 日 -> 备注，只存非空的
+    archived_at: datetime = Field(default_factory=datetime.now)
+
+    class Settings:
+        name = "attendance_archive"
+        indexes = [
+            IndexModel([("employee_id", ASCENDING), ("month", ASCENDING)], name="employee_month_unique", unique=True),
+            IndexModel([("month", ASCENDING), ("employee_id", ASCENDING)], name="month_employee"),
+        ]
+
+
 class LeaveRequest(Document):
     employee_id: PydanticObjectId
     leave_type: LeaveType
@@ -91,6 +193,10 @@ class LeaveRequest(Document):
 
     class Settings:
         name = "leave_requests"
+        indexes = [
+            IndexModel([("employee_id", ASCENDING), ("start_date", DESCENDING)], name="employee_start_date"),
+            IndexModel([("status", ASCENDING), ("start_date", DESCENDING)], name="status_start_date"),
+        ]
 
 
 class LeaveCreate(BaseModel):
@@ -150,3 +256,23 @@ class CheckOutRequest(BaseModel):
 class MarkAbsentRequest(BaseModel):
     employee_code: str
     date: str  # YYYY-MM-DD
+
+# 闸机批量打卡
+class PunchEvent(BaseModel):
+    employee_code: str
+    timestamp: datetime
+    direction: PunchDirection
+
+class BulkPunchRequest(BaseModel):
+    events: List[PunchEvent] = Field(..., min_length=1, max_length=1000)
+
+class PunchResult(BaseModel):
+    index: int
+    employee_code: str
+    direction: PunchDirection
+    outcome: PunchOutcome
+    attendance_id: Optional[str] = None
+
+class BulkPunchResponse(BaseModel):
+    summary: Dict[PunchOutcome, int]
+    results: List[PunchResult]
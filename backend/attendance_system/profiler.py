@@ -0,0 +1,210 @@
+"""按请求的 MongoDB 查询分析（N+1 检测）
+
+默认关闭。QUERY_PROFILING=1 时对所有请求生效，或者单个请求带上 `X-Query-Profile: 1` 请求头。
+开启后：
+- 记录请求期间发出的每条 MongoDB 命令及耗时（通过 contextvar 关联到当前请求；
+  motor 在线程池执行命令时会复制 context，所以监听器回调里能拿到）
+- 同一"查询形状"（命令 + 集合 + 过滤条件的字段结构，去掉具体值）出现次数
+  >= QUERY_PROFILE_REPEAT_THRESHOLD（默认 5）时记为疑似 N+1
+- 超过 QUERY_PROFILE_SLOW_MS（默认 100ms）的查询记录过滤条件，并在响应结束后
+  后台 explain 一次，日志输出执行计划摘要
+- 响应头 X-Query-Profile 返回汇总（流式响应不加，只看日志）；请求结束时日志输出完整汇总
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+from typing import Optional
+
+from pymongo import monitoring
+
+from attendance_system.metrics import command_collection
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ALL = os.getenv("QUERY_PROFILING") == "1"
+PROFILE_HEADER = b"x-query-profile"
+REPEAT_THRESHOLD = int(os.getenv("QUERY_PROFILE_REPEAT_THRESHOLD", "5"))
+SLOW_QUERY_MS = float(os.getenv("QUERY_PROFILE_SLOW_MS", "100"))
+
+EXPLAINABLE = {"find", "aggregate", "count", "distinct"}
+_COMMAND_META_KEYS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "autocommit", "startTransaction", "readConcern"}
+
+_current_profile: contextvars.ContextVar = contextvars.ContextVar("query_profile", default=None)
+_background_tasks = set()
+_client = None  # explain 慢查询用的 motor 客户端
+
+
+def set_client(client):
+    global _client
+    _client = client
+
+
+def _shape(value):
+    """把过滤条件里的具体值换成 ?，只保留字段和操作符结构"""
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{key}:{_shape(value[key])}" for key in sorted(value)) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(sorted({_shape(item) for item in value})) + "]" if value and isinstance(value[0], dict) else "?"
+    return "?"
+
+
+def command_filter(command_name: str, command) -> Optional[dict]:
+    if command_name in ("find", "distinct"):
+        return command.get("filter") or command.get("query")
+    if command_name in ("count", "findAndModify"):
+        return command.get("query")
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline") or []
+        if pipeline and "$match" in pipeline[0]:
+            return pipeline[0]["$match"]
+        return None
+    if command_name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or []
+        return statements[0].get("q") if statements else None
+    return None
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.commands = []  # (shape, duration_ms)
+        self.slow = []  # (shape, duration_ms, database, command, filter)
+        self._lock = threading.Lock()
+
+    def record(self, shape: str, duration_ms: float, database: str, command: Optional[dict], query: Optional[dict]):
+        with self._lock:
+            self.commands.append((shape, duration_ms))
+            if duration_ms >= SLOW_QUERY_MS:
+                self.slow.append((shape, duration_ms, database, command, query))
+
+    def repeated_shapes(self) -> list:
+        counts = {}
+        for shape, _ in self.commands:
+            counts[shape] = counts.get(shape, 0) + 1
+        return sorted(
+            ((shape, count) for shape, count in counts.items() if count >= REPEAT_THRESHOLD),
+            key=lambda item: -item[1],
+        )
+
+    def header_value(self) -> str:
+        with self._lock:
+            total_ms = sum(duration for _, duration in self.commands)
+            count = len(self.commands)
+            slow = len(self.slow)
+        return f"commands={count}; db_time_ms={total_ms:.1f}; repeated_shapes={len(self.repeated_shapes())}; slow={slow}"
+
+
+class QueryProfilerListener(monitoring.CommandListener):
+    """把命令归到发起它的请求（只在当前 context 里有 RequestProfile 时记录）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def started(self, event):
+        profile = _current_profile.get()
+        if profile is None:
+            return
+        name = event.command_name
+        collection = command_collection(name, event.command)
+        query = command_filter(name, event.command)
+        shape = f"{name} {collection} {_shape(query) if query is not None else ''}".rstrip()
+        command = None
+        if name in EXPLAINABLE:
+            command = {key: value for key, value in event.command.items() if key not in _COMMAND_META_KEYS}
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (profile, shape, event.database_name, command, query)
+
+    def _finish(self, event):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        profile, shape, database, command, query = pending
+        profile.record(shape, event.duration_micros / 1000, database, command, query)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+
+query_profiler_listener = QueryProfilerListener()
+
+
+def profiling_requested(scope) -> bool:
+    if PROFILE_ALL:
+        return True
+    for name, value in scope.get("headers", []):
+        if name == PROFILE_HEADER:
+            return value.strip() not in (b"", b"0", b"false")
+    return False
+
+
+def start(method: str, path: str):
+    """开始记录当前请求，返回 (profile, token)"""
+    profile = RequestProfile(method, path)
+    return profile, _current_profile.set(profile)
+
+
+def finish(profile: RequestProfile, token):
+    """结束记录：输出汇总和疑似 N+1，慢查询在后台 explain"""
+    _current_profile.reset(token)
+    logger.info("Query profile %s %s | %s", profile.method, profile.path, profile.header_value())
+    for shape, count in profile.repeated_shapes():
+        logger.warning(
+            "Possible N+1 in %s %s: %d x %s", profile.method, profile.path, count, shape
+        )
+    if profile.slow:
+        task = asyncio.get_running_loop().create_task(_log_slow_queries(profile, _client))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+def plan_summary(explain: dict) -> str:
+    """从 explain 结果里提取获胜计划的阶段链，如 FETCH <- IXSCAN(employee_date_unique)"""
+    def find_plan(node):
+        if isinstance(node, dict):
+            if "winningPlan" in node:
+                return node["winningPlan"]
+            for value in node.values():
+                found = find_plan(value)
+                if found is not None:
+                    return found
+        elif isinstance(node, list):
+            for value in node:
+                found = find_plan(value)
+                if found is not None:
+                    return found
+        return None
+
+    plan = find_plan(explain)
+    if plan is not None and "queryPlan" in plan:
+        plan = plan["queryPlan"]
+    stages = []
+    while isinstance(plan, dict):
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages) if stages else "unknown"
+
+
+async def _log_slow_queries(profile: RequestProfile, client):
+    for shape, duration_ms, database, command, query in profile.slow:
+        summary = "n/a"
+        if client is not None and command is not None:
+            try:
+                explain = await client[database].command({"explain": command, "verbosity": "queryPlanner"})
+                summary = plan_summary(explain)
+            except Exception as e:
+                summary = f"explain failed: {e}"
+        logger.warning(
+            "Slow query in %s %s: %.1fms %s | filter: %s | plan: %s",
+            profile.method, profile.path, duration_ms, shape, query, summary
+        )
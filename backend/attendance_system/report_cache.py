@@ -0,0 +1,226 @@
+"""报表响应缓存（ETag + 数据版本）
+
+报表按 (接口, 参数) 缓存序列化好的 JSON：
+- 每条缓存记下它依赖的范围：部门（None 表示全公司）和日期区间 [start, end]，以及计算开始时的序号
+- 考勤写入（rollups.apply_changes）按 (日期, 部门) 记录最后变更序号；员工写接口让所有报表失效
+- 读缓存时检查依赖范围内有没有比缓存更新的变更（先按月粗查，再按天细查），有就重算
+- 响应带 ETag，请求带 If-None-Match 且一致时返回 304
+- 按序列化后的字节数做 LRU（REPORT_CACHE_MAX_BYTES，默认 32MB）
+- 区间结束在今天之前的历史报表最多缓存 REPORT_CACHE_HISTORY_TTL 秒（默认 300；0 = 永不过期，只适合单进程部署），
+  包含今天或以后的报表最多缓存 REPORT_CACHE_TTL 秒（默认 30）。多进程部署时其他进程的写入
+  （补记缺勤、补批请假、修改旧记录都会改到过去的日期）靠这两个 TTL 兜底
+- 报表在从节点上读时（database.REPORT_READ_PREFERENCE），最近 read_lag_seconds 秒内的变更
+  从节点可能还没复制到：计算时把这些变更当作没看到，它们会让缓存一直失效重算，直到超过这个时间。
+  read_lag_seconds 为 None（没设 REPORT_MAX_STALENESS_SECONDS，延迟没有上界）时不缓存，只算 ETag
+
+失效只在本进程内生效：脚本直接改库（clear_data.py、generate_data.py）后请重启 API。
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import date, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from attendance_system.database import report_read_lag_seconds
+
+ALL = "*"  # 全公司范围
+
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "sequence", "department", "start", "end", "expires_at")
+
+    def __init__(self, body: bytes, etag: str, sequence: int, department: Optional[str],
+                 start: date, end: date, expires_at: Optional[float]):
+        self.body = body
+        self.etag = etag
+        self.sequence = sequence
+        self.department = department
+        self.start = start
+        self.end = end
+        self.expires_at = expires_at
+
+
+class ReportCache:
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 30, history_ttl_seconds: float = 300,
+                 read_lag_seconds: Optional[float] = 0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.history_ttl_seconds = history_ttl_seconds
+        self.read_lag_seconds = read_lag_seconds
+        self.enabled = True  # False 时每次都重算、不缓存（压测用来量未命中的耗时）
+        self._entries: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._sequence = 0
+        self._employees_changed = 0
+        self._days_changed: Dict[Tuple[str, date], int] = {}  # (部门或 ALL, 日期) -> 最后变更序号
+        self._months_changed: Dict[Tuple[str, str], int] = {}  # (部门或 ALL, YYYY-MM) -> 最后变更序号
+        self._recent_changes: "deque[Tuple[float, int]]" = deque()  # 从节点可能还没复制到的 (时间, 序号)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    # ---- 数据版本 ----
+
+    def _next_sequence(self) -> int:
+        self._sequence += 1
+        if self.read_lag_seconds:
+            self._forget_settled()
+            self._recent_changes.append((time.monotonic(), self._sequence))
+        return self._sequence
+
+    def _forget_settled(self):
+        settled = time.monotonic() - self.read_lag_seconds
+        while self._recent_changes and self._recent_changes[0][0] <= settled:
+            self._recent_changes.popleft()
+
+    def _visible_sequence(self) -> int:
+        """报表读能保证看到的最后一个变更序号（在主节点上读就是当前序号）"""
+        if not self.read_lag_seconds:
+            return self._sequence
+        self._forget_settled()
+        if self._recent_changes:
+            return self._recent_changes[0][1] - 1
+        return self._sequence
+
+    def record_change(self, day: date, department: Optional[str] = None):
+        """某天（某部门）的考勤变了"""
+        self._next_sequence()
+        month = f"{day:%Y-%m}"
+        for scope in (ALL, department) if department else (ALL,):
+            self._days_changed[(scope, day)] = self._sequence
+            self._months_changed[(scope, month)] = self._sequence
+
+    def record_employee_change(self):
+        """员工增删改会影响名单、人数和部门归属，所有报表都失效"""
+        self._employees_changed = self._next_sequence()
+
+    def _changed_since(self, entry: CacheEntry) -> bool:
+        if self._employees_changed > entry.sequence:
+            return True
+        scope = entry.department or ALL
+        month_start = entry.start.replace(day=1)
+        while month_start <= entry.end:
+            next_month = (month_start + timedelta(days=32)).replace(day=1)
+            if self._months_changed.get((scope, f"{month_start:%Y-%m}"), 0) > entry.sequence:
+                day = max(month_start, entry.start)
+                last = min(next_month - timedelta(days=1), entry.end)
+                while day <= last:
+                    if self._days_changed.get((scope, day), 0) > entry.sequence:
+                        return True
+                    day += timedelta(days=1)
+            month_start = next_month
+        return False
+
+    # ---- 缓存 ----
+
+    def get(self, key: tuple) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if (entry.expires_at is not None and entry.expires_at < time.monotonic()) or self._changed_since(entry):
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _drop(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+    def put(self, key: tuple, entry: CacheEntry):
+        self._drop(key)
+        if len(entry.body) > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += len(entry.body)
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    async def respond(
+        self,
+        request: Request,
+        key: tuple,
+        start: date,
+        end: date,
+        compute: Callable[[], Awaitable],
+        department: Optional[str] = None,
+    ):
+        """返回缓存的报表（或 304）；未命中时调用 compute() 计算并缓存
+
+        compute 返回 dict 时才缓存；其他返回值（如错误元组）原样交给 FastAPI。
+        """
+        entry = self.get(key) if self.enabled else None
+        if entry is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            sequence = self._visible_sequence()  # 计算期间（以及从节点还没复制到）的写入序号更大，会让这条缓存失效
+            result = await compute()
+            if not isinstance(result, dict):
+                return result
+            body = JSONResponse(jsonable_encoder(result)).body
+            if end < date.today():
+                expires_at = time.monotonic() + self.history_ttl_seconds if self.history_ttl_seconds else None
+            else:
+                expires_at = time.monotonic() + self.ttl_seconds
+            entry = CacheEntry(
+                body=body,
+                etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+                sequence=sequence,
+                department=department,
+                start=start,
+                end=end,
+                expires_at=expires_at,
+            )
+            if self.enabled and self.read_lag_seconds is not None:
+                self.put(key, entry)
+
+        headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 用弱比较：忽略 W/ 前缀，支持逗号分隔的多个值和 *"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+report_cache = ReportCache(
+    max_bytes=int(os.getenv("REPORT_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv("REPORT_CACHE_TTL", "30")),
+    history_ttl_seconds=float(os.getenv("REPORT_CACHE_HISTORY_TTL", "300")),
+    read_lag_seconds=report_read_lag_seconds(),
+)
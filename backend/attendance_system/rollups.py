@@ -0,0 +1,212 @@
+"""考勤预聚合（rollup）
+
+每条工作日考勤记录计入员工当月的计数文档 employee_month:<employee_id>:<YYYY-MM>，
+月度汇总直接读它。
+部门报表不用 rollup：它只统计当前在职的部门员工，按写入时部门累加的计数对不上（见 reports.py）。
+
+写接口在记录变化后调用 apply_change/apply_changes，用 $inc upsert 原子地加减差值，同时让报表缓存失效；
+rebuild_rollups 从 attendance_records 和归档（archive.py）全量重建。重建完成前（没有 meta 文档）
+报表继续走原始记录扫描；meta 文档被删（重建开始、clear_data 清空 rollup）后，
+各进程最多 READY_TTL 秒内也回退到原始记录。rollups_ready / get_employee_month 是报表读，
+按 database.report_collection 的读偏好读。
+"""
+import logging
+import os
+import time
+from datetime import date, datetime
+from typing import Iterable, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from attendance_system import database
+from attendance_system.enums import AttendanceStatus
+from attendance_system.archive import ARCHIVE_FIELDS, decode_month
+from attendance_system.models import AttendanceArchive, AttendanceRecord, AttendanceRollup
+from attendance_system.report_cache import report_cache
+from attendance_system.workdays import business_calendar
+
+logger = logging.getLogger(__name__)
+
+EMPLOYEE_MONTH = "employee_month"
+META_KEY = "meta:built"
+# meta 文档检查结果的缓存秒数
+READY_TTL = float(os.getenv("ROLLUP_READY_TTL", "30"))
+
+COUNTERS = (
+    "records", "present", "late", "half_day", "absent", "on_leave", "on_duty",
+    "total_hours", "check_in_count", "check_in_seconds_sum",
+)
+
+_STATUS_COUNTER = {
+    AttendanceStatus.PRESENT: "present",
+    AttendanceStatus.LATE: "late",
+    AttendanceStatus.HALF_DAY: "half_day",
+    AttendanceStatus.ABSENT: "absent",
+    AttendanceStatus.ON_LEAVE: "on_leave",
+}
+
+_ready_until = 0.0  # time.monotonic()，在此之前不再查 meta 文档
+
+
+class RawRecord:
+    """把原始文档（dict）包装成 apply_changes 需要的记录接口，供脚本批量扣减/补加计数"""
+
+    __slots__ = ("employee_id", "date", "status", "check_in_time", "check_out_time")
+
+    def __init__(self, doc: dict):
+        self.employee_id = doc["employee_id"]
+        self.date = doc["date"]
+        self.status = doc["status"]
+        self.check_in_time = doc.get("check_in_time")
+        self.check_out_time = doc.get("check_out_time")
+
+
+def _as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _department_value(department) -> Optional[str]:
+    return getattr(department, "value", department)
+
+
+def contribution(status, record_date: date, check_in: Optional[datetime], check_out: Optional[datetime]) -> dict:
+    """一条记录对计数的贡献；非工作日（周末、节假日）的记录不计入（报表只统计工作日）"""
+    if record_date is None or not business_calendar.is_working_day(record_date):
+        return {}
+    counters = {"records": 1}
+    field = _STATUS_COUNTER.get(AttendanceStatus(status))
+    if field:
+        counters[field] = 1
+    if check_in and not check_out:
+        counters["on_duty"] = 1
+    if check_in and check_out:
+        counters["total_hours"] = (check_out - check_in).total_seconds() / 3600
+    if check_in:
+        counters["check_in_count"] = 1
+        counters["check_in_seconds_sum"] = (
+            check_in.hour * 3600 + check_in.minute * 60 + check_in.second + check_in.microsecond / 1e6
+        )
+    return counters
+
+
+def rollup_targets(employee_id, record_date: date) -> list:
+    """返回 [(key, $setOnInsert 字段)]"""
+    return [(
+        f"{EMPLOYEE_MONTH}:{employee_id}:{record_date:%Y-%m}",
+        {"scope": EMPLOYEE_MONTH, "employee_id": employee_id, "month": f"{record_date:%Y-%m}"},
+    )]
+
+
+def _accumulate(deltas: dict, record: Optional[AttendanceRecord], sign: int):
+    if record is None:
+        return
+    record_date = _as_date(record.date)
+    counters = contribution(record.status, record_date, record.check_in_time, record.check_out_time)
+    if not counters:
+        return
+    for key, fields in rollup_targets(record.employee_id, record_date):
+        entry = deltas.setdefault(key, (fields, {}))
+        for name, value in counters.items():
+            entry[1][name] = entry[1].get(name, 0) + sign * value
+
+
+async def apply_changes(changes: Iterable[Tuple[Optional[AttendanceRecord], Optional[AttendanceRecord], Optional[str]]], session=None):
+    """changes: [(修改前记录或 None, 修改后记录或 None, 部门)]，一次 bulk_write 写入所有差值"""
+    deltas = {}
+    for before, after, department in changes:
+        department = _department_value(department)
+        _accumulate(deltas, before, -1)
+        _accumulate(deltas, after, 1)
+        # 报表缓存按日期/部门失效（包括非工作日的记录）
+        for record in (before, after):
+            if record is not None and record.date is not None:
+                report_cache.record_change(_as_date(record.date), department)
+
+    operations = []
+    for key, (fields, counters) in deltas.items():
+        counters = {name: value for name, value in counters.items() if value}
+        if not counters:
+            continue
+        operations.append(UpdateOne(
+            {"key": key},
+            {"$inc": counters, "$setOnInsert": fields},
+            upsert=True,
+        ))
+    if not operations:
+        return
+    try:
+        await AttendanceRollup.get_motor_collection().bulk_write(operations, ordered=False, session=session)
+    except Exception:
+        # 原始记录已写入，rollup 失败不影响请求；计数已不可信，删掉 meta 文档让报表回退到原始记录
+        logger.exception("Failed to update attendance rollups; reports fall back to raw records until rebuild_rollups.py is run")
+        try:
+            await invalidate()
+        except Exception:
+            logger.exception("Failed to clear the rollup marker")
+
+
+async def apply_change(before: Optional[AttendanceRecord], after: Optional[AttendanceRecord], department=None, session=None):
+    await apply_changes([(before, after, department)], session=session)
+
+
+async def rollups_ready() -> bool:
+    """rollup 是否已完整重建过（重建前报表回退到原始记录）；结果缓存 READY_TTL 秒，没有 meta 文档时不缓存"""
+    global _ready_until
+    if time.monotonic() < _ready_until:
+        return True
+    if await database.report_collection(AttendanceRollup).count_documents({"key": META_KEY}, limit=1) == 0:
+        return False
+    _ready_until = time.monotonic() + READY_TTL
+    return True
+
+
+async def invalidate():
+    """删除 meta 文档：报表回退到原始记录，直到下次 rebuild_rollups"""
+    global _ready_until
+    _ready_until = 0.0
+    await AttendanceRollup.get_motor_collection().delete_one({"key": META_KEY})
+
+
+async def get_employee_month(employee_id, year: int, month: int) -> dict:
+    doc = await database.report_collection(AttendanceRollup).find_one(
+        {"key": f"{EMPLOYEE_MONTH}:{employee_id}:{year:04d}-{month:02d}"},
+        {name: 1 for name in COUNTERS},
+    )
+    return {name: (doc or {}).get(name, 0) for name in COUNTERS}
+
+
+async def rebuild_rollups(batch_size: int = 1000) -> int:
+    """从 attendance_records 和归档全量重建 rollup，返回写入的文档数
+
+    重建期间的增量更新会被覆盖，请在业务低峰期运行。
+    """
+    global _ready_until
+    totals = {}
+
+    def add(doc):
+        record_date = _as_date(doc.get("date"))
+        counters = contribution(doc["status"], record_date, doc.get("check_in_time"), doc.get("check_out_time"))
+        if not counters:
+            return
+        for key, fields in rollup_targets(doc["employee_id"], record_date):
+            entry = totals.setdefault(key, dict(fields, key=key, **{name: 0 for name in COUNTERS}))
+            for name, value in counters.items():
+                entry[name] += value
+
+    projection = {"employee_id": 1, "date": 1, "status": 1, "check_in_time": 1, "check_out_time": 1}
+    async for doc in AttendanceRecord.get_motor_collection().find({}, projection, batch_size=batch_size):
+        add(doc)
+    async for doc in AttendanceArchive.get_motor_collection().find({}, ARCHIVE_FIELDS, batch_size=batch_size):
+        for record in decode_month(doc):
+            add(record)
+
+    collection = AttendanceRollup.get_motor_collection()
+    # 先删 meta 文档，重建期间报表走原始记录
+    await invalidate()
+    await collection.delete_many({})
+    docs = list(totals.values())
+    for i in range(0, len(docs), batch_size):
+        await collection.insert_many(docs[i:i + batch_size], ordered=False)
+    await collection.insert_one({"key": META_KEY, "scope": "meta", "built_at": datetime.now()})
+    _ready_until = time.monotonic() + READY_TTL
+    return len(docs)
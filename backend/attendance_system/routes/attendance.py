@@ -1,18 +1,30 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Query, Body
+from fastapi import APIRouter, HTTPException, Query, Body
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, model_validator, Field, field_validator
 from typing import List, Optional
 from datetime import datetime, date, timedelta
 from beanie.odm.fields import PydanticObjectId
-from attendance_system.models import AttendanceRecord, LeaveRequest, Employee, CheckInRequest, CheckOutRequest, MarkAbsentRequest, AttendanceRecordWithEmployee
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from bson.errors import InvalidId
+from attendance_system.models import AttendanceRecord, LeaveRequest, Employee, CheckInRequest, CheckOutRequest, MarkAbsentRequest, AttendanceRecordWithEmployee, AttendancePunchView, BulkPunchRequest, BulkPunchResponse, PunchResult, normalize_employee_code
 from attendance_system.database import next_attendance_id, next_leave_id
-from attendance_system.utils import calculate_working_hours, determine_status, is_weekend, get_active_employee_by_code
-from attendance_system.enums import AttendanceStatus, LeaveType, Department
+from attendance_system.utils import calculate_working_hours, determine_status, get_active_employee_by_code, day_start, encode_cursor, decode_cursor, NEXT_CURSOR_RESPONSES
+from attendance_system.enums import AttendanceStatus, LeaveType, Department, PunchDirection, PunchOutcome
+from attendance_system import archive, rollups
+from attendance_system.workdays import business_calendar
+from attendance_system.cache import employee_directory
+from attendance_system.logger import log_event
+from attendance_system.serializers import build_serializer
 
 router = APIRouter(prefix="/attendance", tags=["Attendance"])
 
+serialize_record = build_serializer(AttendanceRecord)
+serialize_record_with_employee = build_serializer(AttendanceRecordWithEmployee, sources={"id": "_id"})
+
 async def get_employee(employee_id: str) -> Employee:
     """获取活跃员工"""
-    employee = await Employee.get(employee_id)
+    employee = await employee_directory.get_by_id(employee_id)
     if not employee or employee.is_deactivated:
         raise HTTPException(status_code=404, detail="Employee not found or inactive")
     return employee
@@ -25,15 +37,15 @@ async def get_attendance_record(attendance_id: int) -> AttendanceRecord:
     return record
 
 @router.post("/check-in/{employee_id}", response_model=AttendanceRecord, status_code=201)
-async def check_in(employee_id: str, background_tasks: BackgroundTasks, check_in_time: Optional[datetime] = None):
-    await get_employee(employee_id)
+async def check_in(employee_id: str, check_in_time: Optional[datetime] = None):
+    employee = await get_employee(employee_id)
     today = (check_in_time or datetime.now()).date()
-    if is_weekend(today):
-        raise HTTPException(400, "Cannot check in on weekend")
+    if not business_calendar.is_working_day(today):
+        raise HTTPException(400, "Cannot check in on weekend or holiday")
     
     emp_obj_id = PydanticObjectId(employee_id)
     existing = await AttendanceRecord.find(AttendanceRecord.employee_id == emp_obj_id, AttendanceRecord.date == today).first_or_none()
-    if existing:
+    if existing or await archive.archived_days([emp_obj_id], [today]):
         raise HTTPException(409, "Already checked in today")
     
     record = AttendanceRecord(
@@ -42,21 +54,26 @@ async def check_in(employee_id: str, background_tasks: BackgroundTasks, check_in
         check_in_time=check_in_time or datetime.now(),
         status=determine_status(check_in_time or datetime.now(), None)
     )
-    await record.insert()
+    try:
+        await record.insert()
+    except DuplicateKeyError:
+        # 并发签到时由 (employee_id, date) 唯一索引兜底
+        raise HTTPException(409, "Already checked in today")
+    await rollups.apply_change(None, record, employee.department)
     
-    background_tasks.add_task(print, f"[LOG] Employee {employee_id} checked in at {record.check_in_time}")
+    log_event("check_in", employee_id=employee_id, check_in_time=record.check_in_time, status=record.status.value)
     return record
 
 
 @router.post("/check-in", response_model=AttendanceRecord, status_code=201)
-async def check_in_body(request: CheckInRequest, background_tasks: BackgroundTasks):
+async def check_in_body(request: CheckInRequest):
     """接收employee_code，查找员工后进行签到"""
     employee = await get_active_employee_by_code(request.employee_code)
-    return await check_in(employee_id=str(employee.id), background_tasks=background_tasks)
+    return await check_in(employee_id=str(employee.id))
 
 
 @router.patch("/check-out", response_model=AttendanceRecord)
-async def check_out(request: CheckOutRequest, background_tasks: BackgroundTasks):
+async def check_out(request: CheckOutRequest):
     """使用 employee_code 签退"""
     # 根据 employee_code 查找员工
     employee = await get_active_employee_by_code(request.employee_code)
@@ -71,12 +88,14 @@ async def check_out(request: CheckOutRequest, background_tasks: BackgroundTasks)
         raise HTTPException(409, "No check-in record or already checked out")
     
     # 更新签退时间和工时
+    before = record.model_copy()
     record.check_out_time = datetime.now()
     record.working_hours = calculate_working_hours(record.check_in_time, record.check_out_time)
     record.status = determine_status(record.check_in_time, record.working_hours)
     await record.save()
+    await rollups.apply_change(before, record, employee.department)
     
-    background_tasks.add_task(print, f"[LOG] Employee {request.employee_code} checked out, hours: {record.working_hours}")
+    log_event("check_out", employee_code=request.employee_code, working_hours=record.working_hours, status=record.status.value)
     return record
 
 
@@ -91,11 +110,11 @@ async def mark_absent(request: MarkAbsentRequest):
     except ValueError:
         raise HTTPException(400, "date format must be YYYY-MM-DD")
     
-    if is_weekend(d):
-        raise HTTPException(400, "Cannot mark absent on weekend")
+    if not business_calendar.is_working_day(d):
+        raise HTTPException(400, "Cannot mark absent on weekend or holiday")
     
     existing = await AttendanceRecord.find(AttendanceRecord.employee_id == employee_id, AttendanceRecord.date == d).first_or_none()
-    if existing:
+    if existing or await archive.archived_days([employee_id], [d]):
         raise HTTPException(409, "Record already exists")
     
     record = AttendanceRecord(
@@ -103,10 +122,211 @@ async def mark_absent(request: MarkAbsentRequest):
         date=d,
         status=AttendanceStatus.ABSENT
     )
-    await record.insert()
+    try:
+        await record.insert()
+    except DuplicateKeyError:
+        raise HTTPException(409, "Record already exists")
+    await rollups.apply_change(None, record, employee.department)
     return record
 
-@router.get("/", response_model=List[AttendanceRecordWithEmployee])
+def _local_naive(ts: datetime) -> datetime:
+    """闸机可能上报带时区的时间，统一转成服务器本地时间（与 datetime.now() 一致），精度截到毫秒（与 BSON 一致）"""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone().replace(tzinfo=None)
+    return ts.replace(microsecond=ts.microsecond // 1000 * 1000)
+
+
+@router.post("/punches", response_model=BulkPunchResponse)
+async def bulk_punch(request: BulkPunchRequest):
+    """闸机批量上报打卡：一次查员工、一次查已有记录、一次无序 bulk_write"""
+    events = request.events
+    employees = await employee_directory.get_many_by_code(e.employee_code for e in events)
+    employees = {code: emp for code, emp in employees.items() if not emp.is_deactivated}
+
+    # 一次取出本批涉及的 (员工, 日期) 已有记录
+    emp_ids = {employees[normalize_employee_code(e.employee_code)].id for e in events if normalize_employee_code(e.employee_code) in employees}
+    days = {_local_naive(e.timestamp).date() for e in events}
+    records = {}
+    if emp_ids:
+        existing = await AttendanceRecord.find(
+            {"employee_id": {"$in": list(emp_ids)}, "date": {"$in": [day_start(d) for d in days]}}
+        ).project(AttendancePunchView).to_list()
+        records = {(r.employee_id, r.date): r for r in existing}
+    # 已归档的日期按已有记录处理，不再签到
+    archived = await archive.archived_days(emp_ids, days)
+
+    outcomes = {}
+    inserts = {}  # key -> 新记录
+    updates = {}  # key -> (原记录快照, 修改后记录)
+    # 同一批内按时间先后处理，保证先签到后签退
+    for index, event in sorted(enumerate(events), key=lambda item: _local_naive(item[1].timestamp)):
+        employee = employees.get(normalize_employee_code(event.employee_code))
+        if employee is None:
+            outcomes[index] = (PunchOutcome.UNKNOWN_EMPLOYEE, None)
+            continue
+        ts = _local_naive(event.timestamp)
+        key = (employee.id, ts.date())
+        record = records.get(key)
+
+        if event.direction == PunchDirection.IN:
+            if not business_calendar.is_working_day(ts.date()):
+                # 节假日也归为 weekend 结果，保持接口取值不变
+                outcomes[index] = (PunchOutcome.WEEKEND, None)
+                continue
+            if record is not None:
+                outcomes[index] = (PunchOutcome.DUPLICATE, record.id)
+                continue
+            if key in archived:
+                outcomes[index] = (PunchOutcome.DUPLICATE, None)
+                continue
+            record = AttendanceRecord(
+                id=PydanticObjectId(),
+                employee_id=employee.id,
+                date=ts.date(),
+                check_in_time=ts,
+                status=determine_status(ts, None)
+            )
+            records[key] = inserts[key] = record
+            outcomes[index] = (PunchOutcome.CREATED, record.id)
+        else:
+            if record is None or not record.check_in_time or ts <= record.check_in_time:
+                outcomes[index] = (PunchOutcome.NO_CHECK_IN, record.id if record else None)
+                continue
+            if record.check_out_time:
+                outcomes[index] = (PunchOutcome.DUPLICATE, record.id)
+                continue
+            if key not in inserts and key not in updates:
+                updates[key] = (record.model_copy(), record)
+            record.check_out_time = ts
+            record.working_hours = calculate_working_hours(record.check_in_time, ts)
+            record.status = determine_status(record.check_in_time, record.working_hours)
+            outcomes[index] = (PunchOutcome.CHECKED_OUT, record.id)
+
+    operations = []
+    op_keys = []
+    for key, record in inserts.items():
+        operations.append(InsertOne({
+            "_id": record.id,
+            "employee_id": record.employee_id,
+            "date": day_start(record.date),
+            "check_in_time": record.check_in_time,
+            "check_out_time": record.check_out_time,
+            "status": record.status.value,
+            "working_hours": record.working_hours,
+            "notes": None,
+        }))
+        op_keys.append(key)
+    for key, (_, record) in updates.items():
+        operations.append(UpdateOne(
+            {"_id": record.id, "check_out_time": None},
+            {"$set": {
+                "check_out_time": record.check_out_time,
+                "working_hours": record.working_hours,
+                "status": record.status.value,
+            }},
+        ))
+        op_keys.append(key)
+
+    failed = set()
+    if operations:
+        try:
+            result = await AttendanceRecord.get_motor_collection().bulk_write(operations, ordered=False)
+            matched = result.matched_count
+        except BulkWriteError as e:
+            # 与其他闸机/接口并发写入同一天：唯一索引冲突按重复处理
+            failed = {op_keys[err["index"]] for err in e.details.get("writeErrors", [])}
+            matched = e.details.get("nMatched", 0)
+        if updates and matched < len(updates):
+            # 签退期间记录已被别处签退，逐条确认哪些没有生效
+            current = AttendanceRecord.get_motor_collection().find(
+                {"_id": {"$in": [record.id for _, record in updates.values()]}},
+                {"check_out_time": 1},
+            )
+            stored = {doc["_id"]: doc.get("check_out_time") async for doc in current}
+            for key, (_, record) in updates.items():
+                if record.id not in stored or stored[record.id] != record.check_out_time:
+                    failed.add(key)
+
+    departments = {emp.id: emp.department for emp in employees.values()}
+    changes = [(None, record, departments[key[0]]) for key, record in inserts.items() if key not in failed]
+    changes += [(before, after, departments[key[0]]) for key, (before, after) in updates.items() if key not in failed]
+
+    # 新建记录与并发写入冲突：改用库里已有的那条，本批对这一天的签退在已有记录上重做
+    failed_inserts = [key for key in failed if key in inserts]
+    replaced = {}  # 本地生成（未写入）的 _id -> 库里记录的 _id
+    redone = {}  # 本地生成的 _id -> 重做签退的结果
+    if failed_inserts:
+        stored = await AttendanceRecord.find(
+            {"$or": [{"employee_id": emp_id, "date": day_start(d)} for emp_id, d in failed_inserts]}
+        ).project(AttendancePunchView).to_list()
+        stored = {(r.employee_id, r.date): r for r in stored}
+        for key in failed_inserts:
+            local, current = inserts[key], stored.get(key)
+            if current is None:
+                continue  # 冲突的记录随后又被删除
+            replaced[local.id] = current.id
+            if local.check_out_time is None:
+                continue
+            if current.check_out_time is not None:
+                redone[local.id] = PunchOutcome.DUPLICATE
+            elif not current.check_in_time or local.check_out_time <= current.check_in_time:
+                redone[local.id] = PunchOutcome.NO_CHECK_IN
+            else:
+                after = current.model_copy()
+                after.check_out_time = local.check_out_time
+                after.working_hours = calculate_working_hours(current.check_in_time, local.check_out_time)
+                after.status = determine_status(current.check_in_time, after.working_hours)
+                result = await AttendanceRecord.get_motor_collection().update_one(
+                    {"_id": current.id, "check_out_time": None},
+                    {"$set": {
+                        "check_out_time": after.check_out_time,
+                        "working_hours": after.working_hours,
+                        "status": after.status.value,
+                    }},
+                )
+                if result.modified_count:
+                    redone[local.id] = PunchOutcome.CHECKED_OUT
+                    changes.append((current, after, departments[key[0]]))
+                else:
+                    redone[local.id] = PunchOutcome.DUPLICATE
+
+    if failed:
+        failed_ids = {records[key].id for key in failed}
+        unsaved_ids = {inserts[key].id for key in failed_inserts}
+        for index, (outcome, record_id) in outcomes.items():
+            if record_id not in failed_ids:
+                continue
+            if record_id in unsaved_ids:
+                # 不返回从未写入的本地 _id
+                if outcome == PunchOutcome.CHECKED_OUT:
+                    outcome = redone.get(record_id, PunchOutcome.DUPLICATE)
+                elif outcome == PunchOutcome.CREATED:
+                    outcome = PunchOutcome.DUPLICATE
+                outcomes[index] = (outcome, replaced.get(record_id))
+            elif outcome == PunchOutcome.CHECKED_OUT:
+                outcomes[index] = (PunchOutcome.DUPLICATE, record_id)
+
+    await rollups.apply_changes(changes)
+
+    results = [
+        PunchResult(
+            index=index,
+            employee_code=event.employee_code,
+            direction=event.direction,
+            outcome=outcomes[index][0],
+            attendance_id=str(outcomes[index][1]) if outcomes[index][1] else None
+        )
+        for index, event in enumerate(events)
+    ]
+    summary = {outcome: 0 for outcome in PunchOutcome}
+    for item in results:
+        summary[item.outcome] += 1
+
+    log_event("bulk_punch", events=len(events), **{outcome.value: count for outcome, count in summary.items()})
+    return BulkPunchResponse(summary=summary, results=results)
+
+
+@router.get("/", response_model=List[AttendanceRecordWithEmployee], responses=NEXT_CURSOR_RESPONSES)
 async def list_attendance(
     employee_id: Optional[str] = None,
     date: Optional[date] = None,
@@ -115,9 +335,10 @@ async def list_attendance(
     status: Optional[AttendanceStatus] = None,
     department: Optional[str] = None,
     skip: int = 0,
-    limit: int = 10
+    limit: int = 10,
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值；提供时忽略 skip"),
 ):
-    """获取考勤记录，包含员工信息"""
+    """获取考勤记录，包含员工信息；按 (date, _id) 排序，支持 skip 和游标两种分页"""
     query = AttendanceRecord.find_all()
     if employee_id:
         query = query.find(AttendanceRecord.employee_id == employee_id)
@@ -129,35 +350,68 @@ async def list_attendance(
         query = query.find(AttendanceRecord.date <= date_to)
     if status:
         query = query.find(AttendanceRecord.status == status)
+    if cursor:
+        # 游标分页：从上一页最后一条 (date, _id) 之后继续，不需要跳过前面的文档
+        position = decode_cursor(cursor)
+        try:
+            last_date = datetime.strptime(position["d"], "%Y-%m-%d").date()
+            last_id = PydanticObjectId(position["i"])
+        except (KeyError, TypeError, ValueError, InvalidId):
+            raise HTTPException(400, "Invalid cursor")
+        query = query.find({"$or": [
+            {"date": {"$gt": last_date}},
+            {"date": last_date, "_id": {"$gt": last_id}},
+        ]})
+    
     if department:
-        # 获取该部门员工 ID 列表
-        dept_emps = await Employee.find(Employee.department == department, Employee.is_deactivated == False).to_list()
-        dept_emp_ids = [emp.id for emp in dept_emps]
-        query = query.find(AttendanceRecord.employee_id.in_(dept_emp_ids))
-    
-    records = await query.skip(skip).limit(limit).to_list()
-    
-    # 获取所有员工信息
-    all_employees = await Employee.find().to_list()
-    emp_map = {str(emp.id): emp for emp in all_employees}
-    
-    # 将记录转换为包含员工信息的格式
-    result = []
-    for record in records:
-        emp = emp_map.get(str(record.employee_id))
-        result.append(AttendanceRecordWithEmployee(
-            id=str(record.id),
-            employee_id=str(record.employee_id),
-            employee_code=emp.employee_code if emp else "N/A",
-            employee_name=emp.full_name if emp else "未知",
-            date=record.date,
-            check_in_time=record.check_in_time,
-            check_out_time=record.check_out_time,
-            status=record.status,
-            working_hours=record.working_hours,
-            notes=record.notes
-        ))
+        # 部门过滤在服务端 join：按 (date, _id) 顺序扫描记录，逐条关联员工并过滤部门，取够一页即停
+        pipeline = [
+            {"$match": query.get_filter_query()},
+            {"$sort": {"date": 1, "_id": 1}},
+            {"$project": archive.RECORD_FIELDS},
+            {"$lookup": {
+                "from": Employee.get_settings().name,
+                "let": {"emp_id": "$employee_id"},
+                "pipeline": [
+                    {"$match": {
+                        "$expr": {"$eq": ["$_id", "$$emp_id"]},
+                        "department": department,
+                        "is_deactivated": False,
+                    }},
+                    {"$project": {"employee_code": 1, "full_name": 1}},
+                ],
+                "as": "employee",
+            }},
+            {"$match": {"employee": {"$ne": []}}},
+        ]
+        if not cursor:
+            pipeline.append({"$skip": skip})
+        pipeline.append({"$limit": limit})
+        docs = await AttendanceRecord.get_motor_collection().aggregate(pipeline).to_list(length=limit)
+        for doc in docs:
+            emp = doc["employee"][0]
+            doc["employee_code"] = emp["employee_code"]
+            doc["employee_name"] = emp["full_name"]
+    else:
+        docs = await AttendanceRecord.get_motor_collection().find(
+            query.get_filter_query(),
+            archive.RECORD_FIELDS,
+            sort=[("date", 1), ("_id", 1)],
+            skip=0 if cursor else skip,
+            limit=limit,
+        ).to_list(length=limit)
+        # 只取本页记录涉及的员工（走员工目录缓存，未命中的一次 $in 查询）
+        emp_map = await employee_directory.get_many(doc["employee_id"] for doc in docs)
+        for doc in docs:
+            emp = emp_map.get(str(doc["employee_id"]))
+            doc["employee_code"] = emp.employee_code if emp else "N/A"
+            doc["employee_name"] = emp.full_name if emp else "未知"
     
+    # 原始文档直接序列化，不再逐行构造模型（response_model 只用于 OpenAPI）
+    result = ORJSONResponse([serialize_record_with_employee(doc) for doc in docs])
+    if docs and len(docs) == limit:
+        last = docs[-1]
+        result.headers["X-Next-Cursor"] = encode_cursor({"d": last["date"].date().isoformat(), "i": str(last["_id"])})
     return result
 
 
@@ -197,11 +451,20 @@ async def get_month_attendance(
     start = date(year, month, 1)
     end = date(year, month, last_day)
     
-    records = await AttendanceRecord.find(
-        AttendanceRecord.employee_id == employee_id,
-        {"date": {"$gte": start, "$lte": end}}
-    ).to_list()
-    return records
+    employee_oid = PydanticObjectId(employee_id)
+    docs = await AttendanceRecord.get_motor_collection().find(
+        {"employee_id": employee_oid, "date": {"$gte": day_start(start), "$lte": day_start(end)}},
+        archive.RECORD_FIELDS,
+    ).to_list(length=None)
+    # 已归档的月份从冷存储读取（同一天以热数据为准）
+    hot_dates = {doc["date"] for doc in docs}
+    archived = [
+        doc for doc in await archive.employee_records(employee_oid, start, end)
+        if doc["date"] not in hot_dates
+    ]
+    if archived:
+        docs = sorted(docs + archived, key=lambda doc: doc["date"])
+    return ORJSONResponse([serialize_record(doc) for doc in docs])
 
 
 @router.put("/{attendance_id}", response_model=AttendanceRecord)
@@ -216,7 +479,10 @@ async def update_attendance(attendance_id: int, update_data: AttendanceRecord):
             update_dict["working_hours"] = calculate_working_hours(check_in, check_out)
             update_dict["status"] = determine_status(check_in, update_dict["working_hours"])
     
+    before = record.model_copy()
     await record.set(update_dict)
+    employee = await employee_directory.get_by_id(record.employee_id)
+    await rollups.apply_change(before, record, employee.department if employee else None)
     return record
 
 
@@ -224,4 +490,6 @@ async def update_attendance(attendance_id: int, update_data: AttendanceRecord):
 async def delete_attendance(attendance_id: int):
     record = await get_attendance_record(attendance_id)
     await record.delete()
+    employee = await employee_directory.get_by_id(record.employee_id)
+    await rollups.apply_change(record, None, employee.department if employee else None)
     return None
\ No newline at end of file
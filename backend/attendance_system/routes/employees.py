@@ -1,13 +1,18 @@
 from datetime import datetime
+from beanie import PydanticObjectId
 from typing import List, Optional
 
-from fastapi import Body, APIRouter, HTTPException, Query, Path, status, Depends
+from fastapi import Body, APIRouter, HTTPException, Query, Path, status, Depends, Response
+from pymongo.errors import DuplicateKeyError
+from bson.errors import InvalidId
 
 from attendance_system.database import next_employee_id
-from attendance_system.models import Employee, EmployeeUpdate,EmployeeCreate
+from attendance_system.models import Employee, EmployeeUpdate,EmployeeCreate, EmployeeBrief, normalize_employee_code
 from attendance_system.enums import Department
 
-from attendance_system.utils import get_active_employee_by_code
+from attendance_system.utils import get_active_employee_by_code, encode_cursor, decode_cursor, NEXT_CURSOR_RESPONSES
+from attendance_system.cache import employee_directory
+from attendance_system.report_cache import report_cache
 
 router = APIRouter(prefix="/employees", tags=["Employees"])
 
@@ -27,36 +32,53 @@ async def create_employee(employee: EmployeeCreate):
     创建新员工
     """
     # 检查员工编号唯一性
-    existing = await Employee.find_one(Employee.employee_code == employee.employee_code)
+    existing = await Employee.find_one(Employee.employee_code == employee.employee_code).project(EmployeeBrief)
     if existing:
         raise HTTPException(status_code=409, detail="Employee code already exists")
     
     # 创建新员工对象并插入数据库
     new_employee = Employee(**employee.model_dump())
-    await new_employee.insert() #保存到数据库
+    try:
+        await new_employee.insert() #保存到数据库
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Employee code already exists")
+    employee_directory.invalidate(new_employee.id, new_employee.employee_code)
+    report_cache.record_employee_change()
 
     new_employee.id = str(new_employee.id) if new_employee.id else None
 
     return new_employee
 
 
-@router.get("/", response_model=List[Employee])
+@router.get("/", response_model=List[Employee], responses=NEXT_CURSOR_RESPONSES)
 async def get_employees(
+    response: Response,
     department: Optional[Department] = None,
     is_active: Optional[bool] = Query(True, description="是否在职"),
     skip: int = Query(0, ge=0),
-    limit: int = Query(10, ge=1, le=100)
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值；提供时忽略 skip"),
 ):
     """
-    获取员工列表
+    获取员工列表（按 _id 排序，支持 skip 和游标两种分页）
     """
     # 构建查询
     query = Employee.find(Employee.is_deactivated == False) if is_active else Employee.find(Employee.is_deactivated == True)
     if department:
-        query = query & (Employee.department == department)
+        query = query.find(Employee.department == department)
+    if cursor:
+        try:
+            last_id = PydanticObjectId(decode_cursor(cursor)["i"])
+        except (KeyError, TypeError, ValueError, InvalidId):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.find({"_id": {"$gt": last_id}})
+    else:
+        query = query.skip(skip)
     
     # 执行查询
-    employees = await query.skip(skip).limit(limit).to_list()
+    employees = await query.sort([("_id", 1)]).limit(limit).to_list()
+    if employees and len(employees) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor({"i": str(employees[-1].id)})
     return employees
 
 
@@ -72,12 +94,12 @@ async def get_employee(employee_id: str):
 
 @router.put("/code/{employee_code}", response_model=Employee)
 async def update_employee_by_code(employee_code: str, updated: EmployeeUpdate):
-    employee = await Employee.find_one(Employee.employee_code == employee_code.upper())
+    employee = await Employee.find_one(Employee.employee_code == normalize_employee_code(employee_code))
     if not employee or employee.is_deactivated:
         raise HTTPException(status_code=404, detail="Employee not found or inactive")
     
     # 不允许改变 EMP_code
-    if updated.employee_code is not None and updated.employee_code.upper() != employee.employee_code:
+    if updated.employee_code is not None and updated.employee_code != employee.employee_code:
         raise HTTPException(status_code=400, detail="Cannot change employee_code")
     
     update_data = updated.model_dump(exclude_unset=True)
@@ -88,8 +110,10 @@ async def update_employee_by_code(employee_code: str, updated: EmployeeUpdate):
     try:
         if update_data:
             await employee.set(update_data)
+            employee_directory.invalidate(employee.id, employee.employee_code)
+            report_cache.record_employee_change()
         # 获取最新数据
-        updated_employee = await Employee.find_one(Employee.employee_code == employee_code.upper())
+        updated_employee = await Employee.find_one(Employee.employee_code == normalize_employee_code(employee_code))
         return updated_employee
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Update failed: {str(e)}")
@@ -97,13 +121,15 @@ async def update_employee_by_code(employee_code: str, updated: EmployeeUpdate):
 
 @router.patch("/code/{employee_code}/deactivate", response_model=Employee)
 async def deactivate_employee_by_code(employee_code: str):
-    employee = await Employee.find_one(Employee.employee_code == employee_code.upper())
+    employee = await Employee.find_one(Employee.employee_code == normalize_employee_code(employee_code))
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     if employee.is_deactivated:
         raise HTTPException(status_code=404, detail="Employee already deactivated")
 
     await employee.set({"is_deactivated": True})
+    employee_directory.invalidate(employee.id, employee.employee_code)
+    report_cache.record_employee_change()
     return employee
 
 
@@ -118,4 +144,6 @@ async def delete_employee(employee_id: str):
         raise HTTPException(status_code=404, detail="Employee not found")
     
     await employee.set({"is_deactivated": True})
+    employee_directory.invalidate(employee.id, employee.employee_code)
+    report_cache.record_employee_change()
     return None
\ No newline at end of file
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException, status, Query
+from fastapi import APIRouter, HTTPException, status, Query, Response
 from typing import List, Optional
-from datetime import date, timedelta, datetime
+from datetime import date, datetime
 from pydantic import BaseModel, Field, ConfigDict
 from beanie.odm.fields import PydanticObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+from bson.errors import InvalidId
 
-from attendance_system.models import LeaveRequest, LeaveCreate, Employee, AttendanceRecord, LeaveRequestWithEmployee, ApproveLeaveRequest
-from attendance_system.utils import calculate_leave_days, is_weekend, get_active_employee_by_code, get_active_employee_by_id
+from attendance_system.models import LeaveRequest, LeaveCreate, AttendanceRecord, LeaveRequestWithEmployee, ApproveLeaveRequest
+from attendance_system.utils import calculate_leave_days, get_active_employee_by_code, get_active_employee_by_id, day_start, encode_cursor, decode_cursor, NEXT_CURSOR_RESPONSES
 from attendance_system.enums import AttendanceStatus, LeaveType
+from attendance_system import archive, rollups
+from attendance_system.workdays import business_calendar
+from attendance_system.cache import employee_directory
+from attendance_system.logger import log_event
 
 
 router = APIRouter(prefix="", tags=["Leave Management"])
@@ -15,9 +22,9 @@ router = APIRouter(prefix="", tags=["Leave Management"])
 async def create_leave_request(request: LeaveCreate):
     # employee_code
     if request.employee_code:
-        employee = await get_active_employee_by_code(request.employee_code.upper())
+        employee = await get_active_employee_by_code(request.employee_code)
     elif request.employee_id:
-        employee = await Employee.get(request.employee_id)
+        employee = await employee_directory.get_by_id(request.employee_id)
     else:
         raise HTTPException(status_code=400, detail="必须提供 employee_code 或 employee_id")
 
@@ -45,13 +52,15 @@ async def create_leave_request(request: LeaveCreate):
     return leave
 
 
-@router.get("/leaves", response_model=List[LeaveRequestWithEmployee])
+@router.get("/leaves", response_model=List[LeaveRequestWithEmployee], responses=NEXT_CURSOR_RESPONSES)
 async def list_leaves(
+    response: Response,
     employee_id: Optional[str] = None,
     status: Optional[str] = None,
     leave_type: Optional[LeaveType] = None,
     skip: int = 0,
-    limit: int = 10
+    limit: int = 10,
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值；提供时忽略 skip"),
 ):
     query = LeaveRequest.find_all()
     if employee_id:
@@ -62,11 +71,22 @@ async def list_leaves(
     if leave_type:
         query = query.find(LeaveRequest.leave_type == leave_type)
     
-    leaves = await query.skip(skip).limit(limit).to_list()
+    if cursor:
+        # 游标分页：按 _id 继续
+        try:
+            last_id = PydanticObjectId(decode_cursor(cursor)["i"])
+        except (KeyError, TypeError, ValueError, InvalidId):
+            raise HTTPException(400, "Invalid cursor")
+        query = query.find({"_id": {"$gt": last_id}})
+    else:
+        query = query.skip(skip)
+    
+    leaves = await query.sort([("_id", 1)]).limit(limit).to_list()
+    if leaves and len(leaves) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor({"i": str(leaves[-1].id)})
     
-    # 获取所有员工
-    all_employees = await Employee.find().to_list()
-    emp_map = {str(emp.id): emp for emp in all_employees}
+    # 只取本页涉及的员工（走员工目录缓存）
+    emp_map = await employee_directory.get_many(leave.employee_id for leave in leaves)
     
     # 转换格式
     result = []
@@ -103,8 +123,61 @@ async def get_leave(leave_id: str):
     return leave
 
 
+_transactions_supported = True
+TRANSACTION_ATTEMPTS = 3
+
+
+def _only_duplicate_keys(e: PyMongoError) -> bool:
+    """BulkWriteError 里全是唯一索引冲突：upsert 查找之后、插入之前，并发签到/补记写入了同一天"""
+    errors = e.details.get("writeErrors", []) if isinstance(e, BulkWriteError) else []
+    return bool(errors) and all(err.get("code") == 11000 for err in errors)
+
+
+async def _commit_with_retry(session):
+    """提交结果未知（网络中断、主节点切换）时重试提交本身，不重跑事务"""
+    for attempt in range(TRANSACTION_ATTEMPTS):
+        try:
+            await session.commit_transaction()
+            return
+        except PyMongoError as e:
+            if not e.has_error_label("UnknownTransactionCommitResult") or attempt == TRANSACTION_ATTEMPTS - 1:
+                raise
+
+
+async def _run_in_transaction(client, operation):
+    """在事务中执行 operation(session)；单机版 MongoDB 不支持事务时退化为无事务执行
+
+    带 TransientTransactionError 标签的错误（例如并发审批撞上的 WriteConflict）和 upsert
+    撞上并发插入的唯一索引冲突整体重跑事务（重跑时 upsert 会匹配到已有记录），最多 TRANSACTION_ATTEMPTS 次。
+    """
+    global _transactions_supported
+    if _transactions_supported:
+        async with await client.start_session() as session:
+            for attempt in range(TRANSACTION_ATTEMPTS):
+                session.start_transaction()
+                try:
+                    result = await operation(session)
+                    await _commit_with_retry(session)
+                    return result
+                except PyMongoError as e:
+                    if session.in_transaction:
+                        await session.abort_transaction()
+                    # 20 = IllegalOperation: Transaction numbers are only allowed on a replica set member or mongos
+                    if isinstance(e, OperationFailure) and e.code == 20:
+                        _transactions_supported = False
+                        break
+                    retryable = e.has_error_label("TransientTransactionError") or _only_duplicate_keys(e)
+                    if not retryable or attempt == TRANSACTION_ATTEMPTS - 1:
+                        raise
+                except BaseException:
+                    if session.in_transaction:
+                        await session.abort_transaction()
+                    raise
+    return await operation(None)
+
+
 @router.patch("/leaves/{leave_id}/approve", response_model=LeaveRequestWithEmployee)
-async def approve_leave(leave_id: str, request: ApproveLeaveRequest, background_tasks: BackgroundTasks):
+async def approve_leave(leave_id: str, request: ApproveLeaveRequest):
     try:
         leave = await LeaveRequest.get(PydanticObjectId(leave_id))
     except:
@@ -114,32 +187,66 @@ async def approve_leave(leave_id: str, request: ApproveLeaveRequest, background_
     if leave.status != "Pending":
         raise HTTPException(400, "Leave already processed")
     
+    # 获取员工
+    employee = await employee_directory.get_by_id(leave.employee_id)
+
+    approved_at = datetime.now()
+    # 预先算出请假区间内的工作日
+    leave_days = business_calendar.working_days(leave.start_date, leave.end_date)
+    # 已归档的日期和已有记录一样保持不变
+    archived = await archive.archived_days([leave.employee_id], leave_days)
+    leave_days = [d for d in leave_days if (leave.employee_id, d) not in archived]
+    # 已有记录（已签到/缺勤）保持不变，只为缺失的日期生成 ON_LEAVE 记录
+    operations = [
+        UpdateOne(
+            {"employee_id": leave.employee_id, "date": day_start(d)},
+            {"$setOnInsert": {
+                "check_in_time": None,
+                "check_out_time": None,
+                "status": AttendanceStatus.ON_LEAVE.value,
+                "working_hours": None,
+                "notes": None,
+            }},
+            upsert=True,
+        )
+        for d in leave_days
+    ]
+
+    async def approve(session):
+        # 带状态条件的更新，防止并发重复审批
+        updated = await LeaveRequest.get_motor_collection().update_one(
+            {"_id": leave.id, "status": "Pending"},
+            {"$set": {"status": "Approved", "approved_by": request.approved_by, "approved_at": approved_at}},
+            session=session,
+        )
+        if updated.matched_count == 0:
+            raise HTTPException(400, "Leave already processed")
+        if not operations:
+            return {}
+        try:
+            result = await AttendanceRecord.get_motor_collection().bulk_write(operations, ordered=False, session=session)
+        except BulkWriteError as e:
+            # 无事务时其余 upsert 已生效，冲突的那几天已有记录，和已签到的日期一样保持不变；
+            # 事务里出错整个事务已中止，交给 _run_in_transaction 重跑
+            if session is not None or not _only_duplicate_keys(e):
+                raise
+            return {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+        return result.upserted_ids
+
+    client = AttendanceRecord.get_motor_collection().database.client
+    upserted_ids = await _run_in_transaction(client, approve)
+
     leave.status = "Approved"
     leave.approved_by = request.approved_by
-    leave.approved_at = datetime.now()
-    await leave.save()
-    
-    # 生成 ON_LEAVE 记录
-    current = leave.start_date
-    while current <= leave.end_date:
-        if not is_weekend(current):
-            existing = await AttendanceRecord.find(
-                AttendanceRecord.employee_id == leave.employee_id,
-                AttendanceRecord.date == current
-            ).first_or_none()
-            if not existing:
-                record = AttendanceRecord(
-                    employee_id=leave.employee_id,
-                    date=current,
-                    status=AttendanceStatus.ON_LEAVE
-                )
-                await record.insert()
-        current += timedelta(days=1)
-    
-    # 获取员工
-    employee = await Employee.get(leave.employee_id)
+    leave.approved_at = approved_at
+
+    created = [
+        AttendanceRecord(id=record_id, employee_id=leave.employee_id, date=leave_days[index], status=AttendanceStatus.ON_LEAVE)
+        for index, record_id in upserted_ids.items()
+    ]
+    await rollups.apply_changes([(None, record, employee.department) for record in created])
     
-    background_tasks.add_task(print, f"[NOTIFICATION] Leave {leave_id} approved for employee {leave.employee_id}")
+    log_event("leave_approved", leave_id=leave_id, employee_id=leave.employee_id, on_leave_records=len(created))
     
     return LeaveRequestWithEmployee(
         id=str(leave.id),
@@ -173,7 +280,7 @@ async def reject_leave(leave_id: str):
     await leave.save()
     
     # 获取员工
-    employee = await Employee.get(leave.employee_id)
+    employee = await employee_directory.get_by_id(leave.employee_id)
     
     return LeaveRequestWithEmployee(
         id=str(leave.id),
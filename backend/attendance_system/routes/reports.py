@@ -1,41 +1,77 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
 from typing import Optional, List
 from datetime import date, datetime, timedelta
-from attendance_system.models import AttendanceRecord, Employee
+from attendance_system.models import AttendanceRecord, Employee, EmployeeBrief, AttendanceStatusView
 from attendance_system.enums import AttendanceStatus, Department
+from attendance_system.utils import count_working_days, day_start
+from attendance_system.workdays import business_calendar
+from attendance_system import archive, database, rollups, stats
+from attendance_system.report_cache import report_cache
 from fastapi.responses import StreamingResponse
+from beanie import PydanticObjectId
+from bson.errors import InvalidId
 import csv
 from io import StringIO
 
 router = APIRouter(prefix="/reports", tags=["Reports"])
 
+
+async def report_find(model, view, query: dict) -> list:
+    """报表读：按 REPORT_READ_PREFERENCE 路由（可能落到从节点），结果解析成投影视图"""
+    cursor = database.report_collection(model).find(query, view.Settings.projection)
+    return [view.model_validate(doc) async for doc in cursor]
+
+
 @router.get("/daily-summary")
-async def daily_summary(report_date: date):
-    active_emps = await Employee.find(Employee.is_deactivated == False).to_list()
-    day_records = await AttendanceRecord.find({"date": report_date}).to_list()
-
-    # 统计数量
-    present = len([r for r in day_records if r.status in [AttendanceStatus.PRESENT, AttendanceStatus.LATE]])
-    absent = len([r for r in day_records if r.status == AttendanceStatus.ABSENT])
-    late = len([r for r in day_records if r.status == AttendanceStatus.LATE])
-    on_leave = len([r for r in day_records if r.status == AttendanceStatus.ON_LEAVE])
-    on_duty = len([r for r in day_records if r.check_in_time is not None and r.check_out_time is None])
-
-    # 各种员工ID集合（统一为字符串，便于与 Employee.id 比较）
-    recorded_emp_ids = {str(r.employee_id) for r in day_records}  # 任何有记录的（签到/缺勤/请假）
-    present_emp_ids = {str(r.employee_id) for r in day_records if r.status in [AttendanceStatus.PRESENT, AttendanceStatus.LATE]}
-    late_emp_ids = {str(r.employee_id) for r in day_records if r.status == AttendanceStatus.LATE}
-    on_leave_emp_ids = {str(r.employee_id) for r in day_records if r.status == AttendanceStatus.ON_LEAVE}
-
-    # 缺勤名单：活跃员工中完全没有记录的（使用字符串ID）
-    absent_emp_ids = {str(e.id) for e in active_emps} - recorded_emp_ids
+async def daily_summary(request: Request, report_date: date):
+    return await report_cache.respond(
+        request, ("daily-summary", report_date), report_date, report_date,
+        lambda: build_daily_summary(report_date),
+    )
+
+
+async def build_daily_summary(report_date: date) -> dict:
+    active_emps = await report_find(Employee, EmployeeBrief, {"is_deactivated": False})
+    day_records = await report_find(AttendanceRecord, AttendanceStatusView, {"date": day_start(report_date)})
+    # 已归档的日期从冷存储补齐（同一员工以热数据为准）
+    hot_emp_ids = {r.employee_id for r in day_records}
+    day_records += [
+        AttendanceStatusView(**raw) for raw in await archive.records_on(report_date)
+        if raw["employee_id"] not in hot_emp_ids
+    ]
+
+    emp_map = {str(e.id): e for e in active_emps}
+
+    # 一次遍历同时统计数量和名单（dict 保序去重，统一为字符串ID）
+    present = late = on_leave = on_duty = 0
+    recorded_emp_ids = set()  # 任何有记录的（签到/缺勤/请假）
+    present_emp_ids = {}
+    late_emp_ids = {}
+    on_leave_emp_ids = {}
+    for r in day_records:
+        emp_id = str(r.employee_id)
+        recorded_emp_ids.add(emp_id)
+        if r.status in (AttendanceStatus.PRESENT, AttendanceStatus.LATE):
+            present += 1
+            present_emp_ids[emp_id] = None
+        if r.status == AttendanceStatus.LATE:
+            late += 1
+            late_emp_ids[emp_id] = None
+        elif r.status == AttendanceStatus.ON_LEAVE:
+            on_leave += 1
+            on_leave_emp_ids[emp_id] = None
+        if r.check_in_time is not None and r.check_out_time is None:
+            on_duty += 1
+
+    # 缺勤名单：活跃员工中完全没有记录的
+    absent_emp_ids = [emp_id for emp_id in emp_map if emp_id not in recorded_emp_ids]
 
     # 名单（返回对象而不是字符串，便于前端灵活展示）
     def get_emp_info(emp_id):
-        emp = next((e for e in active_emps if str(e.id) == emp_id), None)
+        emp = emp_map.get(emp_id)
         if emp:
             return {
-                "id": str(emp.id),
+                "id": emp_id,
                 "full_name": emp.full_name,
                 "employee_code": emp.employee_code
             }
@@ -55,33 +91,64 @@ async def daily_summary(report_date: date):
         "on_leave_employees": [get_emp_info(eid) for eid in on_leave_emp_ids]
     }
 
+CSV_HEADER = ["Employee Code", "Name", "Date", "Check In", "Check Out", "Hours", "Status"]
+CSV_CHUNK_ROWS = 500
+
+
+async def iter_monthly_csv(year: int, month: int, chunk_rows: int = CSV_CHUNK_ROWS):
+    """逐块生成月度 CSV：一次范围查询，游标推进时按块输出，内存只与块大小和员工数相关"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+
+    emps = await report_find(Employee, EmployeeBrief, {"is_deactivated": False})
+    emp_map = {emp.id: emp for emp in emps}
+
+    # 精确的月份区间 [本月1日, 下月1日)
+    month_start = date(year, month, 1)
+    next_month = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+
+    cursor = database.report_collection(AttendanceRecord).find(
+        {
+            "employee_id": {"$in": list(emp_map)},
+            "date": {"$gte": day_start(month_start), "$lt": day_start(next_month)},
+        },
+        {"employee_id": 1, "date": 1, "check_in_time": 1, "check_out_time": 1, "working_hours": 1, "status": 1},
+        sort=[("employee_id", 1), ("date", 1)],
+        batch_size=chunk_rows,
+    )
+
+    # 归档过的月份和热数据按同样的顺序合并
+    records = archive.merge_sorted(cursor, archive.archived_records(archive.month_key(month_start), list(emp_map)))
+
+    rows = 0
+    async for doc in records:
+        emp = emp_map[doc["employee_id"]]
+        check_in = doc.get("check_in_time")
+        check_out = doc.get("check_out_time")
+        hours = doc.get("working_hours")
+        writer.writerow([
+            emp.employee_code,
+            emp.full_name,
+            doc["date"].date(),
+            check_in.strftime("%H:%M") if check_in else "",
+            check_out.strftime("%H:%M") if check_out else "",
+            round(hours, 2) if hours else "",
+            doc["status"]
+        ])
+        rows += 1
+        if rows % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+
+
 @router.get("/monthly-csv")
-async def monthly_csv(year: int, month: int):
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Employee Code", "Name", "Date", "Check In", "Check Out", "Hours", "Status"])
-
-    emps = await Employee.find(Employee.is_deactivated == False).to_list()
-    for emp in emps:
-        records = await AttendanceRecord.find(
-            AttendanceRecord.employee_id == emp.id,
-            {"date": {"$gte": date(year, month, 1), "$lt": date(year, month, 28) + timedelta(days=5)}}
-        ).to_list()
-        records = [r for r in records if r.date.year == year and r.date.month == month]
-        for r in records:
-            writer.writerow([
-                emp.employee_code,
-                emp.full_name,
-                r.date,
-                r.check_in_time.strftime("%H:%M") if r.check_in_time else "",
-                r.check_out_time.strftime("%H:%M") if r.check_out_time else "",
-                round(r.working_hours, 2) if r.working_hours else "",
-                r.status.value
-            ])
-
-    output.seek(0)
+async def monthly_csv(year: int, month: int = Query(..., ge=1, le=12)):
     return StreamingResponse(
-        output,
+        iter_monthly_csv(year, month),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=attendance_{year}_{month:02d}.csv"}
     )
@@ -89,6 +156,7 @@ async def monthly_csv(year: int, month: int):
 
 @router.get("/employee/{employee_id}/monthly-summary")
 async def get_employee_monthly_summary(
+    request: Request,
     employee_id: str,
     year: int = Query(None),
     month: int = Query(None)
@@ -98,9 +166,21 @@ async def get_employee_monthly_summary(
     today = date.today()
     target_year = year or today.year
     target_month = month or today.month
-    
-    # 找员工
-    emp = await Employee.get(employee_id)
+    month_start, next_month = archive.month_bounds(f"{target_year:04d}-{target_month:02d}")
+    return await report_cache.respond(
+        request, ("employee-monthly-summary", employee_id, target_year, target_month),
+        month_start, next_month - timedelta(days=1),
+        lambda: build_employee_monthly_summary(employee_id, target_year, target_month),
+    )
+
+
+async def build_employee_monthly_summary(employee_id: str, target_year: int, target_month: int) -> dict:
+    # 找员工（只需要姓名）
+    try:
+        emps = await report_find(Employee, EmployeeBrief, {"_id": PydanticObjectId(employee_id)})
+    except InvalidId:
+        emps = []
+    emp = emps[0] if emps else None
     if not emp:
         return {"error": "Employee not found"}, 404
     
@@ -111,61 +191,34 @@ async def get_employee_monthly_summary(
     else:
         month_end = date(target_year, target_month + 1, 1) - timedelta(days=1)
     
-    # 该员工该月所有记录
-    records = await AttendanceRecord.find(
-        AttendanceRecord.employee_id == emp.id,
-        {"date": {"$gte": month_start, "$lte": month_end}}
-    ).to_list()
-    
-    # 统计
-    from attendance_system.utils import is_weekend
-    working_days = 0
-    present_days = 0
-    late_days = 0
-    absent_days = 0
-    leave_days = 0
-    total_hours = 0.0
-    check_in_times = []
-    
-    current_date = month_start
-    while current_date <= month_end:
-        if not is_weekend(current_date):
-            working_days += 1
-            day_records = [r for r in records if r.date == current_date]
-            
-            if day_records:
-                record = day_records[0]
-                if record.status == AttendanceStatus.PRESENT:
-                    present_days += 1
-                elif record.status == AttendanceStatus.LATE:
-                    late_days += 1
-                    present_days += 1
-                elif record.status == AttendanceStatus.ABSENT:
-                    absent_days += 1
-                elif record.status == AttendanceStatus.ON_LEAVE:
-                    leave_days += 1
-                
-                # 累计工时
-                if record.check_in_time and record.check_out_time:
-                    hours = (record.check_out_time - record.check_in_time).total_seconds() / 3600
-                    total_hours += hours
-                
-                # 收集签到时间
-                if record.check_in_time:
-                    check_in_times.append(record.check_in_time.time())
-            else:
-                absent_days += 1
-        
-        current_date += timedelta(days=1)
+    working_days = count_working_days(month_start, month_end)
+    if await rollups.rollups_ready():
+        # 直接读该员工当月的预聚合文档
+        counters = await rollups.get_employee_month(emp.id, target_year, target_month)
+        present_days = counters["present"] + counters["late"]
+        late_days = counters["late"]
+        # 没有任何记录的工作日也算缺勤
+        absent_days = counters["absent"] + working_days - counters["records"]
+        leave_days = counters["on_leave"]
+        total_hours = counters["total_hours"]
+        check_in_count = counters["check_in_count"]
+        check_in_seconds = counters["check_in_seconds_sum"]
+    else:
+        # rollup 未就绪：列式统计，热数据和归档一次读完
+        columns = await stats.load_columns([emp.id], month_start, month_end)
+        summary = stats.employee_summary(columns, working_days)[0]
+        present_days = summary["present_days"]
+        late_days = summary["late_days"]
+        absent_days = summary["absent_days"]
+        leave_days = summary["leave_days"]
+        total_hours = summary["total_hours"]
+        check_in_count = summary["check_in_count"]
+        check_in_seconds = summary["check_in_seconds"]
     
     # 计算平均签到时间
     avg_check_in = None
-    if check_in_times:
-        from datetime import time
-        total_seconds = sum((datetime.combine(date.today(), t) - datetime.combine(date.today(), time(0, 0, 0))).total_seconds() for t in check_in_times)
-        avg_seconds = total_seconds / len(check_in_times)
-        avg_time = (datetime.combine(date.today(), time(0, 0, 0)) + timedelta(seconds=avg_seconds)).time()
-        avg_check_in = avg_time.strftime("%H:%M:%S")
+    if check_in_count:
+        avg_check_in = stats.format_time_of_day(check_in_seconds / check_in_count)
     
     # 出勤率
     attendance_rate = (present_days / working_days * 100) if working_days > 0 else 0
@@ -188,6 +241,7 @@ async def get_employee_monthly_summary(
 
 @router.get("/department/{department}/attendance")
 async def get_department_attendance(
+    request: Request,
     department: str,
     date_from: Optional[str] = Query(None),
     date_to: Optional[str] = Query(None)
@@ -202,51 +256,31 @@ async def get_department_attendance(
         end_date = datetime.strptime(date_to, "%Y-%m-%d").date()
     else:
         end_date = date.today()
-    
+
+    return await report_cache.respond(
+        request, ("department-attendance", department, start_date, end_date), start_date, end_date,
+        lambda: build_department_attendance(department, start_date, end_date),
+        department=department,
+    )
+
+
+async def build_department_attendance(department: str, start_date: date, end_date: date) -> dict:
     # 获取该部门员工
-    dept_employees = await Employee.find(Employee.department == department, Employee.is_deactivated == False).to_list()
+    dept_employees = await report_find(Employee, EmployeeBrief, {"department": department, "is_deactivated": False})
 
     if not dept_employees:
         return {"error": "Department not found or no active employees"}, 404
 
     total_employees = len(dept_employees)
-    total_late = 0
-    total_absent = 0
-    attendance_rates = []
-    
-    from attendance_system.utils import is_weekend
-    
-    for emp in dept_employees:
-        emp_records = await AttendanceRecord.find(
-            AttendanceRecord.employee_id == emp.id,
-            {"date": {"$gte": start_date, "$lte": end_date}}
-        ).to_list()
-        
-        # 计算出勤率
-        working_days = 0
-        present_days = 0
-        
-        current = start_date
-        while current <= end_date:
-            if not is_weekend(current):
-                working_days += 1
-                day_rec = next((r for r in emp_records if r.date == current), None)
-                if day_rec and day_rec.status in [AttendanceStatus.PRESENT, AttendanceStatus.LATE]:
-                    present_days += 1
-            current += timedelta(days=1)
-        
-        if working_days > 0:
-            rate = present_days / working_days * 100
-            attendance_rates.append(rate)
-        
-        # 累计迟到、缺勤
-        late_count = len([r for r in emp_records if r.status == AttendanceStatus.LATE])
-        absent_count = len([r for r in emp_records if r.status == AttendanceStatus.ABSENT])
-        
-        total_late += late_count
-        total_absent += absent_count
-    
-    avg_attendance_rate = sum(attendance_rates) / len(attendance_rates) if attendance_rates else 0
+
+    # 只统计当前在职的部门员工：整个部门的区间记录一次读成列再统计。
+    # 不用 rollup：计数按写入时的部门归属累加，会带上已停用和调走的员工，而且不含非工作日的迟到/缺勤
+    working_days = count_working_days(start_date, end_date)
+    columns = await stats.load_columns([emp.id for emp in dept_employees], start_date, end_date)
+    summary = stats.department_summary(columns, working_days)
+    avg_attendance_rate = summary["avg_attendance_rate"]
+    total_late = summary["total_late"]
+    total_absent = summary["total_absent"]
     
     return {
         "department": department,
@@ -259,11 +293,50 @@ async def get_department_attendance(
     }
 
 
+async def archived_punctuality(start_date: date, end_date: date) -> dict:
+    """归档月份里各员工区间内的 [出勤日, 迟到数]（只算工作日，出勤含半天）
+
+    同一员工同一天热数据里也有记录时以热数据为准（聚合管道已经算过），这里跳过。
+    """
+    low, high = day_start(start_date), day_start(end_date)
+    present_statuses = {AttendanceStatus.PRESENT.value, AttendanceStatus.LATE.value, AttendanceStatus.HALF_DAY.value}
+    rows = []
+    for month in archive.months_between(start_date, end_date):
+        async for row in archive.archived_records(month):
+            if low <= row["date"] <= high and business_calendar.is_working_day(row["date"]):
+                rows.append(row)
+    if not rows:
+        return {}
+
+    hot_days = set()
+    cursor = database.report_collection(AttendanceRecord).find(
+        {
+            "employee_id": {"$in": list({row["employee_id"] for row in rows})},
+            "date": {"$in": list({row["date"] for row in rows})},
+        },
+        {"_id": 0, "employee_id": 1, "date": 1},
+    )
+    async for doc in cursor:
+        hot_days.add((doc["employee_id"], doc["date"]))
+
+    counts = {}
+    for row in rows:
+        if (row["employee_id"], row["date"]) in hot_days:
+            continue
+        entry = counts.setdefault(row["employee_id"], [0, 0])
+        if row["status"] in present_statuses:
+            entry[0] += 1
+        if row["status"] == AttendanceStatus.LATE.value:
+            entry[1] += 1
+    return counts
+
+
 @router.get("/punctuality-ranking")
 async def get_punctuality_ranking(
+    request: Request,
     date_from: Optional[str] = Query(None),
     date_to: Optional[str] = Query(None),
-    limit: int = Query(10)
+    limit: int = Query(10, ge=1)
 ):
     # 解析日期
     if date_from:
@@ -275,87 +348,104 @@ async def get_punctuality_ranking(
         end_date = datetime.strptime(date_to, "%Y-%m-%d").date()
     else:
         end_date = date.today()
-    
-    from attendance_system.utils import is_weekend
-    
-    rankings = []
-    
-    emps = await Employee.find().to_list()
-    for emp in emps:
-        if emp.is_deactivated:
-            continue
-        # Query records for this employee and date range (use dict filter)
-        emp_records = await AttendanceRecord.find({
-            "employee_id": emp.id,
-            "date": {"$gte": start_date, "$lte": end_date}
-        }).to_list()
-
-        # Build a map date -> chosen record (deduplicate multiple records per date)
-        records_by_date = {}
-        for r in emp_records:
-            d = r.date
-            existing = records_by_date.get(d)
-            if not existing:
-                records_by_date[d] = r
-                continue
-
-            # Prefer records with a check_in_time. If both have check_in_time,
-            # choose the earliest check_in_time (true first sign-in).
-            if existing.check_in_time and r.check_in_time:
-                if r.check_in_time < existing.check_in_time:
-                    records_by_date[d] = r
-                continue
-
-            if r.check_in_time and not existing.check_in_time:
-                records_by_date[d] = r
-                continue
-
-            if existing.check_in_time and not r.check_in_time:
-                continue
-
-            # If neither has check_in_time, prefer ON_LEAVE over others
-            if r.status == AttendanceStatus.ON_LEAVE and existing.status != AttendanceStatus.ON_LEAVE:
-                records_by_date[d] = r
-                continue
-            if existing.status == AttendanceStatus.ON_LEAVE and r.status != AttendanceStatus.ON_LEAVE:
-                continue
-
-            # Otherwise keep the existing record
-
-        # 计算统计
-        working_days = 0
-        present_days = 0
-        late_count = 0
-
-        current = start_date
-        while current <= end_date:
-            if not is_weekend(current):
-                working_days += 1
-                day_rec = records_by_date.get(current)
-                if day_rec:
-                    if day_rec.status == AttendanceStatus.LATE:
-                        late_count += 1
-                        present_days += 1
-                    elif day_rec.status in [AttendanceStatus.PRESENT, AttendanceStatus.HALF_DAY]:
-                        present_days += 1
-            current += timedelta(days=1)
-        
-        attendance_rate = (present_days / working_days * 100) if working_days > 0 else 0
-        
-        rankings.append({
-            "employee_code": emp.employee_code,
-            "employee_name": emp.full_name,
-            "attendance_rate": round(attendance_rate, 2),
-            "late_count": late_count,
+
+    return await report_cache.respond(
+        request, ("punctuality-ranking", start_date, end_date, limit), start_date, end_date,
+        lambda: build_punctuality_ranking(start_date, end_date, limit),
+    )
+
+
+async def build_punctuality_ranking(start_date: date, end_date: date, limit: int) -> dict:
+    # 整个区间的工作日数只算一次
+    working_days = count_working_days(start_date, end_date)
+    non_working = [day_start(d) for d in business_calendar.non_working_days(start_date, end_date)]
+    if working_days > 0:
+        rate_expr = {"$round": [{"$multiply": [{"$divide": ["$present_days", working_days]}, 100]}, 2]}
+    else:
+        rate_expr = {"$literal": 0}
+
+    # 区间落在归档月份时，排名要加上归档里的计数，只能取回全部员工后在这里排序
+    archived_counts = await archived_punctuality(start_date, end_date)
+    ranking_stages = [
+        # 出勤率降序、迟到升序
+        {"$sort": {"attendance_rate": -1, "late_count": 1, "_id": 1}},
+        {"$limit": limit},
+    ]
+    if archived_counts:
+        # $facet 的子管道不能为空
+        ranking_stages = [{"$sort": {"_id": 1}}]
+
+    pipeline = [
+        {"$match": {"is_deactivated": False}},
+        {"$project": {"employee_code": 1, "full_name": 1}},
+        {"$lookup": {
+            "from": AttendanceRecord.get_settings().name,
+            "let": {"emp_id": "$_id"},
+            "pipeline": [
+                # 只统计工作日：排除区间内的周末和节假日
+                {"$match": {
+                    "date": {"$gte": day_start(start_date), "$lte": day_start(end_date), "$nin": non_working},
+                    "$expr": {"$eq": ["$employee_id", "$$emp_id"]},
+                }},
+                # 同一天有多条记录时：优先最早签到，其次请假记录
+                {"$addFields": {"_rank": {"$cond": [
+                    {"$ifNull": ["$check_in_time", False]},
+                    0,
+                    {"$cond": [{"$eq": ["$status", AttendanceStatus.ON_LEAVE.value]}, 1, 2]},
+                ]}}},
+                {"$sort": {"date": 1, "_rank": 1, "check_in_time": 1, "_id": 1}},
+                {"$group": {"_id": "$date", "status": {"$first": "$status"}}},
+                {"$group": {
+                    "_id": None,
+                    "present_days": {"$sum": {"$cond": [{"$in": ["$status", [
+                        AttendanceStatus.PRESENT.value,
+                        AttendanceStatus.LATE.value,
+                        AttendanceStatus.HALF_DAY.value,
+                    ]]}, 1, 0]}},
+                    "late_count": {"$sum": {"$cond": [{"$eq": ["$status", AttendanceStatus.LATE.value]}, 1, 0]}},
+                }},
+            ],
+            "as": "stats",
+        }},
+        {"$project": {
+            "employee_code": 1,
+            "full_name": 1,
+            "present_days": {"$ifNull": [{"$arrayElemAt": ["$stats.present_days", 0]}, 0]},
+            "late_count": {"$ifNull": [{"$arrayElemAt": ["$stats.late_count", 0]}, 0]},
+        }},
+        {"$addFields": {"attendance_rate": rate_expr}},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "rankings": ranking_stages,
+        }},
+    ]
+
+    result = await database.report_collection(Employee).aggregate(pipeline).to_list(length=1)
+    facet = result[0] if result else {"total": [], "rankings": []}
+    if archived_counts:
+        for row in facet["rankings"]:
+            present_days, late_count = archived_counts.get(row["_id"], (0, 0))
+            row["present_days"] += present_days
+            row["late_count"] += late_count
+            row["attendance_rate"] = round(row["present_days"] / working_days * 100, 2) if working_days > 0 else 0
+        facet["rankings"] = sorted(
+            facet["rankings"], key=lambda row: (-row["attendance_rate"], row["late_count"], row["_id"])
+        )[:limit]
+
+    rankings = [
+        {
+            "employee_code": row["employee_code"],
+            "employee_name": row["full_name"],
+            "attendance_rate": row["attendance_rate"],
+            "late_count": row["late_count"],
             "working_days": working_days
-        })
-    
-    # 出勤率降序、迟到升序
-    rankings.sort(key=lambda x: (-x["attendance_rate"], x["late_count"]))
+        }
+        for row in facet["rankings"]
+    ]
     
     return {
         "date_from": start_date.isoformat(),
         "date_to": end_date.isoformat(),
-        "total_ranked": len(rankings),
-        "rankings": rankings[:limit]
-    }
\ No newline at end of file
+        "total_ranked": facet["total"][0]["count"] if facet["total"] else 0,
+        "rankings": rankings
+    }
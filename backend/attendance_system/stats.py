@@ -0,0 +1,167 @@
+"""列式考勤统计（NumPy）
+
+把一段时间内若干员工的考勤（热数据 + 归档）一次读成列：
+    员工序号 / 日期 ordinal / 状态码 / 签到时刻（当天零点起的微秒）/ 签到到签退的微秒数
+之后出勤、迟到、缺勤、请假、工时、平均签到都是 bincount 之类的向量运算，
+不再按天、按员工循环。报表在 rollup 还没重建好时用它，口径与原先逐日循环的结果一致：
+- 同一员工同一天有多条记录时取第一条（热数据在前，归档在后）
+- 出勤/迟到/缺勤/请假天数、工时、签到只统计工作日；没有记录的工作日算缺勤
+- 部门的迟到/缺勤总数按所有去重后的记录统计（含非工作日）
+时间都用整数微秒累加，最后再换算成小时/秒。
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import List
+
+import numpy as np
+
+from attendance_system import archive, database
+from attendance_system.enums import AttendanceStatus
+from attendance_system.models import AttendanceRecord
+from attendance_system.utils import day_start
+from attendance_system.workdays import business_calendar
+
+STATUS_CODE = {status.value: code for code, status in enumerate(AttendanceStatus)}
+PRESENT = STATUS_CODE[AttendanceStatus.PRESENT.value]
+LATE = STATUS_CODE[AttendanceStatus.LATE.value]
+ABSENT = STATUS_CODE[AttendanceStatus.ABSENT.value]
+ON_LEAVE = STATUS_CODE[AttendanceStatus.ON_LEAVE.value]
+
+PROJECTION = {"employee_id": 1, "date": 1, "status": 1, "check_in_time": 1, "check_out_time": 1}
+MICROS_PER_SECOND = 1_000_000
+MICROS_PER_HOUR = 3600 * MICROS_PER_SECOND
+
+
+@dataclass
+class RecordColumns:
+    start: date
+    end: date
+    employees: int
+    employee: np.ndarray  # int32，员工在 employee_ids 里的序号
+    day: np.ndarray  # int32，date.toordinal()
+    status: np.ndarray  # int8，STATUS_CODE
+    check_in: np.ndarray  # int64，签到时刻（当天零点起的微秒）
+    has_check_in: np.ndarray  # bool
+    span: np.ndarray  # int64，签退 - 签到（微秒）
+    has_span: np.ndarray  # bool
+
+    def working(self) -> np.ndarray:
+        """每条记录的日期是否为工作日"""
+        mask = np.frombuffer(business_calendar.mask(self.start, self.end), dtype=np.uint8).astype(bool)
+        return mask[self.day - self.start.toordinal()]
+
+    def count(self, selected: np.ndarray) -> np.ndarray:
+        return np.bincount(self.employee[selected], minlength=self.employees)
+
+    def total(self, selected: np.ndarray, values: np.ndarray) -> np.ndarray:
+        return np.bincount(self.employee[selected], weights=values[selected], minlength=self.employees)
+
+
+def _micros_of_day(t) -> int:
+    return ((t.hour * 60 + t.minute) * 60 + t.second) * MICROS_PER_SECOND + t.microsecond
+
+
+def _span_micros(check_in, check_out) -> int:
+    delta = check_out - check_in
+    return (delta.days * 86400 + delta.seconds) * MICROS_PER_SECOND + delta.microseconds
+
+
+def build_columns(rows: list, employee_ids: list, start: date, end: date) -> RecordColumns:
+    """rows 为原始记录 dict（热数据在前）；同一员工同一天只保留第一条"""
+    index = {employee_id: i for i, employee_id in enumerate(employee_ids)}
+    n = len(rows)
+    employee = np.empty(n, dtype=np.int32)
+    day = np.empty(n, dtype=np.int32)
+    status = np.empty(n, dtype=np.int8)
+    check_in = np.zeros(n, dtype=np.int64)
+    has_check_in = np.zeros(n, dtype=bool)
+    span = np.zeros(n, dtype=np.int64)
+    has_span = np.zeros(n, dtype=bool)
+
+    for i, row in enumerate(rows):
+        employee[i] = index[row["employee_id"]]
+        day[i] = row["date"].toordinal()
+        status[i] = STATUS_CODE[row["status"]]
+        t_in = row.get("check_in_time")
+        t_out = row.get("check_out_time")
+        if t_in:
+            check_in[i] = _micros_of_day(t_in)
+            has_check_in[i] = True
+            if t_out:
+                span[i] = _span_micros(t_in, t_out)
+                has_span[i] = True
+
+    # (员工, 日期) 去重：np.unique 返回每个键第一次出现的位置
+    keys = employee.astype(np.int64) * 4_000_000 + day
+    _, first = np.unique(keys, return_index=True)
+    first.sort()
+    return RecordColumns(
+        start=start, end=end, employees=len(employee_ids),
+        employee=employee[first], day=day[first], status=status[first],
+        check_in=check_in[first], has_check_in=has_check_in[first],
+        span=span[first], has_span=has_span[first],
+    )
+
+
+async def load_columns(employee_ids: List, start: date, end: date) -> RecordColumns:
+    """一次范围查询读出热数据，再补上覆盖到的归档月份"""
+    low, high = day_start(start), day_start(end)
+    rows = await database.report_collection(AttendanceRecord).find(
+        {"employee_id": {"$in": employee_ids}, "date": {"$gte": low, "$lte": high}},
+        PROJECTION,
+    ).to_list(length=None)
+    for month in archive.months_between(start, end):
+        async for row in archive.archived_records(month, employee_ids):
+            if low <= row["date"] <= high:
+                rows.append(row)
+    return build_columns(rows, employee_ids, start, end)
+
+
+def employee_summary(columns: RecordColumns, working_days: int) -> List[dict]:
+    """每个员工的月度统计字段（与 get_employee_monthly_summary 的口径一致）"""
+    working = columns.working()
+    status = columns.status
+    records = columns.count(working)
+    present = columns.count(working & ((status == PRESENT) | (status == LATE)))
+    late = columns.count(working & (status == LATE))
+    absent = columns.count(working & (status == ABSENT))
+    on_leave = columns.count(working & (status == ON_LEAVE))
+    span_micros = columns.total(working & columns.has_span, columns.span)
+    check_in_count = columns.count(working & columns.has_check_in)
+    check_in_micros = columns.total(working & columns.has_check_in, columns.check_in)
+
+    return [
+        {
+            "present_days": int(present[i]),
+            "late_days": int(late[i]),
+            # 没有记录的工作日也算缺勤
+            "absent_days": int(absent[i]) + working_days - int(records[i]),
+            "leave_days": int(on_leave[i]),
+            "total_hours": float(span_micros[i]) / MICROS_PER_HOUR,
+            "check_in_count": int(check_in_count[i]),
+            "check_in_seconds": float(check_in_micros[i]) / MICROS_PER_SECOND,
+        }
+        for i in range(columns.employees)
+    ]
+
+
+def department_summary(columns: RecordColumns, working_days: int) -> dict:
+    """部门统计：各员工出勤率的平均值，以及迟到、缺勤记录总数"""
+    status = columns.status
+    present = columns.count(columns.working() & ((status == PRESENT) | (status == LATE)))
+    if working_days > 0 and columns.employees:
+        rates = present / working_days * 100
+        avg_attendance_rate = sum(rates.tolist()) / columns.employees
+    else:
+        avg_attendance_rate = 0
+    return {
+        "avg_attendance_rate": avg_attendance_rate,
+        "total_late": int(np.count_nonzero(status == LATE)),
+        "total_absent": int(np.count_nonzero(status == ABSENT)),
+    }
+
+
+def format_time_of_day(seconds: float) -> str:
+    """秒数 -> HH:MM:SS（先舍入到微秒再截断到秒，与 datetime + timedelta 的结果相同）"""
+    whole = round(seconds * MICROS_PER_SECOND) // MICROS_PER_SECOND % 86400
+    return f"{whole // 3600:02d}:{whole // 60 % 60:02d}:{whole % 60:02d}"
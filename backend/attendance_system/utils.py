@@ -1,9 +1,14 @@
-from datetime import datetime, time, timedelta, date
+import base64
+import binascii
+import json
+from datetime import datetime, time, date
 from typing import Optional
 
 from fastapi import HTTPException
 from attendance_system.enums import AttendanceStatus
 from attendance_system.models import Employee
+from attendance_system.cache import employee_directory
+from attendance_system.workdays import business_calendar
 
 def calculate_working_hours(check_in: datetime, check_out: datetime) -> float:
     delta = check_out - check_in
@@ -23,25 +28,50 @@ def determine_status(check_in: Optional[datetime], working_hours: Optional[float
 def is_weekend(d: date) -> bool:
     return d.weekday() >= 5
 
+def day_start(d: date) -> datetime:
+    """Beanie 把 date 字段存成当天 00:00 的 datetime，原生查询/聚合时需要同样转换"""
+    return datetime.combine(d, time.min)
+
+def count_working_days(start: date, end: date) -> int:
+    """[start, end] 区间内的工作日数量（按工作日日历，扣除周末和节假日）"""
+    return business_calendar.count(start, end)
+
 def calculate_leave_days(start: date, end: date) -> int:
-    days = 0
-    current = start
-    while current <= end:
-        if not is_weekend(current):
-            days += 1
-        current += timedelta(days=1)
-    return days
+    return business_calendar.count(start, end)
+
+def encode_cursor(values: dict) -> str:
+    """把分页位置编码成不透明的游标字符串"""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+# 列表接口的下一页游标放在响应头里，响应体仍是数组（兼容现有调用方）；写进 OpenAPI 文档
+NEXT_CURSOR_RESPONSES = {
+    200: {"headers": {"X-Next-Cursor": {
+        "description": "下一页游标（本页取满 limit 条时才有），作为 ?cursor= 传回",
+        "schema": {"type": "string"},
+    }}},
+}
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
 
 async def get_active_employee_by_code(employee_code: str) -> Employee:
     """根据员工编号查找员工"""
-    employee = await Employee.find_one(Employee.employee_code == employee_code.upper())
+    employee = await employee_directory.get_by_code(employee_code)
     if not employee or employee.is_deactivated:
         raise HTTPException(status_code=404, detail="Employee not found or inactive")
     return employee
 
 async def get_active_employee_by_id(employee_id: str) -> Employee:
     """根据 ObjectId 查找员工"""
-    employee = await Employee.get(employee_id)
+    employee = await employee_directory.get_by_id(employee_id)
     if not employee or employee.is_deactivated:
         raise HTTPException(status_code=404, detail="Employee not found or inactive")
     return employee
\ No newline at end of file
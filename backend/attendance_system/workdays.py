@@ -0,0 +1,155 @@
+"""工作日日历
+
+按年预先算好每天是否上班的位图和前缀和：
+- 周一到周五上班，周末休息
+- PUBLIC_HOLIDAYS（逗号分隔的 YYYY-MM-DD）和 HOLIDAYS_FILE（每行一个日期，# 开头为注释）中的日期休息
+- MAKEUP_WORKDAYS（调休上班的周末，格式同 PUBLIC_HOLIDAYS）上班
+
+count(start, end) 用两个前缀和相减，O(1)；用到某一年时才构建那一年（每年 366 字节位图 + 前缀数组）。
+rollup 只统计工作日，节假日配置改动后需要重跑 rebuild_rollups.py。
+"""
+import os
+import threading
+from array import array
+from datetime import date, timedelta
+from typing import Iterable, List, NamedTuple, Optional
+
+
+def parse_dates(text: str) -> set:
+    """解析逗号或换行分隔的 YYYY-MM-DD 列表，忽略空项和 # 注释"""
+    dates = set()
+    for line in text.replace(",", "\n").splitlines():
+        value = line.split("#", 1)[0].strip()
+        if value:
+            try:
+                dates.add(date.fromisoformat(value))
+            except ValueError:
+                raise ValueError(f"Invalid holiday date {value!r}, expected YYYY-MM-DD")
+    return dates
+
+
+def load_dates(env_name: str, file_env_name: str = None) -> set:
+    dates = parse_dates(os.getenv(env_name, ""))
+    path = os.getenv(file_env_name) if file_env_name else None
+    if path:
+        with open(path, encoding="utf-8") as f:
+            dates |= parse_dates(f.read())
+    return dates
+
+
+class _YearTable(NamedTuple):
+    """已构建年份的位图和前缀和；构建好之后不再修改"""
+    first_year: int
+    last_year: int
+    base: int  # 第一年 1 月 1 日的 ordinal
+    bitmap: bytes  # 从 base 起每天 1=上班 0=休息
+    prefix: array  # prefix[i] = base 起前 i 天的工作日数
+
+
+class BusinessCalendar:
+    def __init__(self, holidays: Iterable[date] = (), makeup_workdays: Iterable[date] = ()):
+        self.holidays = frozenset(holidays)
+        self.makeup_workdays = frozenset(makeup_workdays)
+        self._lock = threading.Lock()
+        self._table: Optional[_YearTable] = None
+
+    def _flag(self, d: date) -> int:
+        if d in self.makeup_workdays:
+            return 1
+        if d.weekday() >= 5 or d in self.holidays:
+            return 0
+        return 1
+
+    def _year_flags(self, year: int) -> bytearray:
+        first = date(year, 1, 1)
+        days = (date(year + 1, 1, 1) - first).days if year < 9999 else 365
+        return bytearray(self._flag(first + timedelta(days=i)) for i in range(days))
+
+    def _ensure(self, first_year: int, last_year: int) -> _YearTable:
+        """返回覆盖 [first_year, last_year] 的表
+
+        表只在锁内构建，新表建好后一次赋值发布，读者拿到的总是完整的一张表。
+        """
+        table = self._table
+        if table is not None and table.first_year <= first_year and last_year <= table.last_year:
+            return table
+        with self._lock:
+            table = self._table
+            if table is not None and table.first_year <= first_year and last_year <= table.last_year:
+                return table
+            if table is None or first_year < table.first_year:
+                # 往前扩展：整体重建
+                last_year = max(last_year, table.last_year if table else last_year)
+                bitmap = bytearray()
+                prefix = array("q", [0])
+                years = range(first_year, last_year + 1)
+            else:
+                # 往后追加（在副本上追加，正在读旧表的调用不受影响）
+                first_year = table.first_year
+                bitmap = bytearray(table.bitmap)
+                prefix = array("q", table.prefix)
+                years = range(table.last_year + 1, last_year + 1)
+            total = prefix[-1]
+            for year in years:
+                flags = self._year_flags(year)
+                bitmap += flags
+                for flag in flags:
+                    total += flag
+                    prefix.append(total)
+            table = _YearTable(first_year, last_year, date(first_year, 1, 1).toordinal(), bytes(bitmap), prefix)
+            self._table = table
+            return table
+
+    def is_working_day(self, d: date) -> bool:
+        table = self._ensure(d.year, d.year)
+        return bool(table.bitmap[d.toordinal() - table.base])
+
+    def count(self, start: date, end: date) -> int:
+        """[start, end] 区间内的工作日数"""
+        if end < start:
+            return 0
+        table = self._ensure(start.year, end.year)
+        return table.prefix[end.toordinal() - table.base + 1] - table.prefix[start.toordinal() - table.base]
+
+    def mask(self, start: date, end: date) -> bytes:
+        """[start, end] 每天一个字节，1=工作日（给向量化统计用）"""
+        if end < start:
+            return b""
+        table = self._ensure(start.year, end.year)
+        return table.bitmap[start.toordinal() - table.base:end.toordinal() - table.base + 1]
+
+    def working_days(self, start: date, end: date) -> List[date]:
+        if end < start:
+            return []
+        table = self._ensure(start.year, end.year)
+        first = start.toordinal() - table.base
+        bitmap = table.bitmap
+        return [
+            date.fromordinal(table.base + i)
+            for i in range(first, end.toordinal() - table.base + 1)
+            if bitmap[i]
+        ]
+
+    def non_working_days(self, start: date, end: date) -> List[date]:
+        if end < start:
+            return []
+        table = self._ensure(start.year, end.year)
+        first = start.toordinal() - table.base
+        bitmap = table.bitmap
+        return [
+            date.fromordinal(table.base + i)
+            for i in range(first, end.toordinal() - table.base + 1)
+            if not bitmap[i]
+        ]
+
+    def next_working_day(self, d: date) -> date:
+        """d 本身是工作日时返回 d"""
+        while not self.is_working_day(d):
+            d += timedelta(days=1)
+        return d
+
+
+business_calendar = BusinessCalendar(
+    holidays=load_dates("PUBLIC_HOLIDAYS", "HOLIDAYS_FILE"),
+    makeup_workdays=load_dates("MAKEUP_WORKDAYS"),
+)
@@ -0,0 +1,512 @@
+"""
+benchmark.py
+
+In-process load test for the attendance API.
+
+The FastAPI `app` is driven through httpx's ASGITransport (no uvicorn, no
+network) against a dedicated, deterministically seeded MongoDB database, so
+two runs with the same arguments on the same machine are comparable.
+
+Usage:
+  python benchmark.py                           # seed + run every scenario
+  python benchmark.py --scenarios checkin_burst,reports_daily_summary
+  python benchmark.py --compare bench_results/<previous>.json
+  python benchmark.py --list
+
+Environment:
+  BENCH_MONGODB_URL   default mongodb://localhost:27017/attendance_bench
+                      The database is DROPPED and re-seeded on every run, so
+                      its name must contain "bench".
+
+Scenarios:
+  checkin_burst                 every employee checks in between 08:45 and 09:10
+  checkout                      every employee checks out (open records seeded for today)
+  list_attendance_skip_deep     skip/limit pages at increasing depth
+  list_attendance_cursor        walking pages via X-Next-Cursor
+  reports_daily_summary         /reports/daily-summary for the last weekdays
+  reports_monthly_csv           /reports/monthly-csv for every seeded month
+  reports_employee_monthly      /reports/employee/{id}/monthly-summary
+  reports_department            /reports/department/{dept}/attendance over the full history
+  reports_punctuality           /reports/punctuality-ranking over the full history
+  leave_approval                approving pending leave requests
+
+The report scenarios that go through the report cache are measured twice:
+`<scenario>` with the cache bypassed (every request recomputes the report) and
+`<scenario>:cached` with a warm cache (every request is a hit).
+
+Results (throughput and p50/p95/p99 per scenario, plus the git commit and run
+parameters) are written as JSON to bench_results/ unless --output is given.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+BENCH_MONGODB_URL = os.getenv("BENCH_MONGODB_URL", "mongodb://localhost:27017/attendance_bench")
+# database.py 在导入时读取 MONGODB_URL，必须先指向压测库
+os.environ["MONGODB_URL"] = BENCH_MONGODB_URL
+
+import httpx
+from bson import ObjectId
+
+from attendance_system import database, main as api
+from attendance_system.cache import employee_directory
+from attendance_system.enums import Department, LeaveType, AttendanceStatus
+from attendance_system.models import Employee, AttendanceRecord, LeaveRequest
+from attendance_system.report_cache import report_cache
+from attendance_system.rollups import rebuild_rollups
+from attendance_system.utils import calculate_working_hours, determine_status, day_start
+from attendance_system.workdays import business_calendar
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+SEED_EPOCH = 0x65000000  # 固定的 ObjectId 时间部分，保证 (date, _id) 排序每次一致
+INSERT_BATCH = 5000
+
+SCENARIOS = [
+    "checkin_burst",
+    "checkout",
+    "list_attendance_skip_deep",
+    "list_attendance_cursor",
+    "reports_daily_summary",
+    "reports_monthly_csv",
+    "reports_employee_monthly",
+    "reports_department",
+    "reports_punctuality",
+    "leave_approval",
+]
+# 走报表缓存的场景：分别测未命中（绕过缓存）和命中
+CACHED_SCENARIOS = {
+    "reports_daily_summary",
+    "reports_employee_monthly",
+    "reports_department",
+    "reports_punctuality",
+}
+
+
+def object_id(kind: int, n: int) -> ObjectId:
+    return ObjectId(f"{SEED_EPOCH:08x}{kind:02x}{n:014x}")
+
+
+def weekdays(start: date, end: date):
+    return business_calendar.working_days(start, end)
+
+
+def next_weekday(d: date) -> date:
+    return business_calendar.next_working_day(d)
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """最近秩法；sorted_values 必须已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def git_revision():
+    def run(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    try:
+        return run("rev-parse", "HEAD"), bool(run("status", "--porcelain", "--untracked-files=no"))
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+class Plan:
+    """由 seed 决定的压测数据和时间点"""
+
+    def __init__(self, seed: int, employees: int, days: int, pending_leaves: int):
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.employee_count = employees
+        self.today = date.today()
+        self.history_end = self.today - timedelta(days=1)
+        self.history_start = self.history_end - timedelta(days=days - 1)
+        # 签到高峰放在未来的工作日，避开历史数据和今天的签退数据
+        self.burst_day = next_weekday(self.today + timedelta(days=7))
+        self.leave_start = next_weekday(self.burst_day + timedelta(days=7))
+        self.pending_leaves = min(pending_leaves, employees)
+        self.employees = []
+        self.leave_ids = []
+
+    def months(self):
+        months = []
+        d = self.history_start.replace(day=1)
+        while d <= self.history_end:
+            months.append((d.year, d.month))
+            d = (d + timedelta(days=32)).replace(day=1)
+        return months
+
+
+def seed_employees(plan: Plan):
+    departments = list(Department)
+    docs = []
+    for i in range(1, plan.employee_count + 1):
+        docs.append({
+            "_id": object_id(1, i),
+            "employee_code": f"EMP{i:03d}",
+            "full_name": f"Bench Employee {i}",
+            "email": f"bench{i}@company.com",
+            "department": departments[i % len(departments)].value,
+            "position": "Developer",
+            "hire_date": day_start(date(2020, 1, 1)),
+            "is_deactivated": False,
+            "created_at": datetime(2020, 1, 1),
+        })
+    plan.employees = docs
+    return docs
+
+
+def attendance_doc(rng: random.Random, n: int, employee_id: ObjectId, d: date):
+    """一天的考勤：约 2% 缺勤，其余按签到时间分布出 Present/Late/Half Day"""
+    if rng.random() < 0.02:
+        return {
+            "_id": object_id(2, n), "employee_id": employee_id, "date": day_start(d),
+            "check_in_time": None, "check_out_time": None,
+            "status": AttendanceStatus.ABSENT.value, "working_hours": None, "notes": None,
+        }
+    check_in = datetime.combine(d, dtime(8, 30)) + timedelta(seconds=int(rng.gauss(25, 15) * 60))
+    hours = 4 * 3600 if rng.random() < 0.03 else 9 * 3600
+    check_out = check_in + timedelta(seconds=hours + rng.randint(-1800, 1800))
+    working_hours = calculate_working_hours(check_in, check_out)
+    return {
+        "_id": object_id(2, n), "employee_id": employee_id, "date": day_start(d),
+        "check_in_time": check_in, "check_out_time": check_out,
+        "status": determine_status(check_in, working_hours).value,
+        "working_hours": working_hours, "notes": None,
+    }
+
+
+async def insert_batched(collection, docs):
+    for i in range(0, len(docs), INSERT_BATCH):
+        await collection.insert_many(docs[i:i + INSERT_BATCH], ordered=False)
+
+
+async def seed(plan: Plan, skip_rollups: bool):
+    db = database.db
+    started = time.perf_counter()
+
+    employees = seed_employees(plan)
+    await insert_batched(Employee.get_motor_collection(), employees)
+
+    rng = plan.rng
+    records = []
+    n = 0
+    for d in weekdays(plan.history_start, plan.history_end):
+        for emp in employees:
+            n += 1
+            records.append(attendance_doc(rng, n, emp["_id"], d))
+            if len(records) >= INSERT_BATCH:
+                await insert_batched(AttendanceRecord.get_motor_collection(), records)
+                records = []
+    # 今天的未签退记录，供 checkout 场景使用
+    morning = datetime.now() - timedelta(hours=8)
+    for emp in employees:
+        n += 1
+        records.append({
+            "_id": object_id(2, n), "employee_id": emp["_id"], "date": day_start(plan.today),
+            "check_in_time": morning, "check_out_time": None,
+            "status": determine_status(morning, None).value, "working_hours": None, "notes": None,
+        })
+    await insert_batched(AttendanceRecord.get_motor_collection(), records)
+
+    leaves = []
+    leave_end = plan.leave_start + timedelta(days=4)
+    for i, emp in enumerate(employees[:plan.pending_leaves], start=1):
+        leave_id = object_id(3, i)
+        leaves.append({
+            "_id": leave_id, "employee_id": emp["_id"], "leave_type": LeaveType.ANNUAL_LEAVE.value,
+            "start_date": day_start(plan.leave_start), "end_date": day_start(leave_end),
+            "total_days": sum(1 for _ in weekdays(plan.leave_start, leave_end)),
+            "reason": "benchmark", "status": "Pending", "requested_at": datetime(2020, 1, 1),
+            "approved_by": None, "approved_at": None,
+        })
+        plan.leave_ids.append(str(leave_id))
+    if leaves:
+        await insert_batched(LeaveRequest.get_motor_collection(), leaves)
+
+    if not skip_rollups:
+        await rebuild_rollups()
+    employee_directory.clear()
+
+    record_count = await db[AttendanceRecord.get_settings().name].estimated_document_count()
+    print(f"seeded {len(employees)} employees, {record_count} attendance records, "
+          f"{len(leaves)} pending leaves ({time.perf_counter() - started:.1f}s)")
+    return record_count
+
+
+class Recorder:
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    async def call(self, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+        self.statuses[response.status_code] = self.statuses.get(response.status_code, 0) + 1
+        if response.status_code >= 400:
+            self.errors += 1
+        return response
+
+    def summary(self, wall_seconds: float) -> dict:
+        values = sorted(self.latencies)
+
+        def ms(seconds):
+            return round(seconds * 1000, 3)
+
+        return {
+            "requests": len(values),
+            "errors": self.errors,
+            "statuses": {str(code): count for code, count in sorted(self.statuses.items())},
+            "concurrency": self.concurrency,
+            "duration_s": round(wall_seconds, 3),
+            "throughput_rps": round(len(values) / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+            "latency_ms": {
+                "min": ms(values[0]) if values else 0.0,
+                "mean": ms(sum(values) / len(values)) if values else 0.0,
+                "p50": ms(percentile(values, 50)),
+                "p95": ms(percentile(values, 95)),
+                "p99": ms(percentile(values, 99)),
+                "max": ms(values[-1]) if values else 0.0,
+            },
+        }
+
+
+async def run_requests(recorder: Recorder, client: httpx.AsyncClient, requests):
+    """requests: [(method, url, kwargs)]，以 recorder.concurrency 并发执行"""
+    semaphore = asyncio.Semaphore(recorder.concurrency)
+
+    async def one(method, url, kwargs):
+        async with semaphore:
+            await recorder.call(client, method, url, **kwargs)
+
+    await asyncio.gather(*(one(method, url, kwargs) for method, url, kwargs in requests))
+
+
+def scenario_requests(name: str, plan: Plan, record_count: int, repeat: int):
+    rng = random.Random(plan.seed + SCENARIOS.index(name))
+    if name == "checkin_burst":
+        requests = []
+        for emp in plan.employees:
+            check_in = datetime.combine(plan.burst_day, dtime(8, 45)) + timedelta(seconds=rng.randint(0, 25 * 60))
+            requests.append(("POST", f"/attendance/check-in/{emp['_id']}", {"params": {"check_in_time": check_in.isoformat()}}))
+        rng.shuffle(requests)
+        return requests
+    if name == "checkout":
+        requests = [("PATCH", "/attendance/check-out", {"json": {"employee_code": emp["employee_code"]}}) for emp in plan.employees]
+        rng.shuffle(requests)
+        return requests
+    if name == "list_attendance_skip_deep":
+        limit = 100
+        depths = [0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+        return [
+            ("GET", "/attendance/", {"params": {"skip": int(record_count * depth), "limit": limit}})
+            for depth in depths
+        ] * repeat
+    if name == "reports_daily_summary":
+        days = list(weekdays(plan.history_start, plan.history_end))[-20:]
+        return [("GET", "/reports/daily-summary", {"params": {"report_date": d.isoformat()}}) for d in days] * repeat
+    if name == "reports_monthly_csv":
+        return [("GET", "/reports/monthly-csv", {"params": {"year": y, "month": m}}) for y, m in plan.months()] * repeat
+    if name == "reports_employee_monthly":
+        year, month = plan.months()[-1]
+        sample = rng.sample(plan.employees, min(50, len(plan.employees)))
+        return [
+            ("GET", f"/reports/employee/{emp['_id']}/monthly-summary", {"params": {"year": year, "month": month}})
+            for emp in sample
+        ] * repeat
+    if name == "reports_department":
+        window = {"date_from": plan.history_start.isoformat(), "date_to": plan.history_end.isoformat()}
+        return [("GET", f"/reports/department/{dept.value}/attendance", {"params": window}) for dept in Department] * repeat
+    if name == "reports_punctuality":
+        window = {"date_from": plan.history_start.isoformat(), "date_to": plan.history_end.isoformat(), "limit": 10}
+        return [("GET", "/reports/punctuality-ranking", {"params": window})] * (5 * repeat)
+    if name == "leave_approval":
+        return [("PATCH", f"/leaves/{leave_id}/approve", {"json": {"approved_by": 1}}) for leave_id in plan.leave_ids]
+    raise ValueError(name)
+
+
+async def run_cursor_walk(recorder: Recorder, client: httpx.AsyncClient, pages: int):
+    """顺序翻页：每页用上一页的 X-Next-Cursor"""
+    cursor = None
+    for _ in range(pages):
+        params = {"limit": 100}
+        if cursor:
+            params["cursor"] = cursor
+        response = await recorder.call(client, "GET", "/attendance/", params=params)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+
+def print_result(name: str, result: dict):
+    latency = result["latency_ms"]
+    print(f"{name:28} {result['requests']:6d} req  {result['throughput_rps']:9.1f} req/s  "
+          f"p50 {latency['p50']:8.2f}ms  p95 {latency['p95']:8.2f}ms  p99 {latency['p99']:8.2f}ms  "
+          f"errors {result['errors']}")
+
+
+async def timed_requests(name: str, client: httpx.AsyncClient, requests, args) -> dict:
+    recorder = Recorder(name, args.concurrency)
+    started = time.perf_counter()
+    await run_requests(recorder, client, requests)
+    result = recorder.summary(time.perf_counter() - started)
+    print_result(name, result)
+    return result
+
+
+async def run_scenario(name: str, client: httpx.AsyncClient, plan: Plan, record_count: int, args) -> dict:
+    """返回 {结果名: 结果}；走报表缓存的场景返回未命中和命中两份"""
+    # 写操作场景按 --concurrency 并发；只读场景也一样，但先不计时地跑一遍预热
+    if name == "list_attendance_cursor":
+        recorder = Recorder(name, 1)
+        await run_cursor_walk(Recorder(name, 1), client, 3)
+        started = time.perf_counter()
+        await run_cursor_walk(recorder, client, args.cursor_pages)
+        result = recorder.summary(time.perf_counter() - started)
+        print_result(name, result)
+        return {name: result}
+
+    requests = scenario_requests(name, plan, record_count, args.repeat)
+    if name.startswith("reports_") or name.startswith("list_"):
+        await run_requests(Recorder(name, args.concurrency), client, requests[:args.concurrency])
+    if name not in CACHED_SCENARIOS:
+        return {name: await timed_requests(name, client, requests, args)}
+
+    # 未命中：绕过缓存，每个请求都重算
+    report_cache.enabled = False
+    try:
+        missed = await timed_requests(name, client, requests, args)
+    finally:
+        report_cache.enabled = True
+    # 命中：每个不同的请求先不计时地跑一遍填满缓存
+    report_cache.clear()
+    await run_requests(Recorder(name, args.concurrency), client, list({repr(r): r for r in requests}.values()))
+    hits_before = report_cache.hits
+    cached = await timed_requests(f"{name}:cached", client, requests, args)
+    cached["cache_hits"] = report_cache.hits - hits_before
+    return {name: missed, f"{name}:cached": cached}
+
+
+def compare(baseline_path: str, current: dict):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    base_commit = (baseline.get("meta", {}).get("git_commit") or "?")[:10]
+    print(f"\ncompared with {baseline_path} (commit {base_commit})")
+    print(f"{'scenario':28} {'rps':>18} {'p50 ms':>22} {'p95 ms':>22} {'p99 ms':>22}")
+
+    def delta(old, new):
+        if not old:
+            return f"{new:10.2f}"
+        return f"{old:8.2f}->{new:8.2f} ({(new - old) / old * 100:+6.1f}%)"
+
+    for name, result in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            print(f"{name:28} (new)")
+            continue
+        cells = [delta(old["throughput_rps"], result["throughput_rps"])]
+        for pct in ("p50", "p95", "p99"):
+            cells.append(delta(old["latency_ms"][pct], result["latency_ms"][pct]))
+        print(f"{name:28} " + " ".join(cells))
+
+
+async def main(args):
+    db_name = BENCH_MONGODB_URL.split("/")[-1].split("?")[0]
+    if "bench" not in db_name:
+        sys.exit(f"refusing to drop database {db_name!r}: BENCH_MONGODB_URL must point at a database whose name contains 'bench'")
+
+    selected = SCENARIOS if not args.scenarios else [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in selected if s not in SCENARIOS]
+    if unknown:
+        sys.exit(f"unknown scenarios: {', '.join(unknown)} (see --list)")
+    if not 1 <= args.employees <= 999999:
+        sys.exit("--employees must be between 1 and 999999 (employee codes are EMP001-EMP999999)")
+
+    # ASGITransport 不触发 lifespan，手动初始化连接和 Beanie
+    await api.startup_db()
+    await database.client.drop_database(db_name)
+    api.shutdown_db()
+    await api.startup_db()  # 重新建索引
+
+    plan = Plan(args.seed, args.employees, args.days, args.pending_leaves)
+    record_count = await seed(plan, args.skip_rollups)
+
+    results = {}
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name in selected:
+            results.update(await run_scenario(name, client, plan, record_count, args))
+
+    commit, dirty = git_revision()
+    output = {
+        "meta": {
+            "git_commit": commit,
+            "git_dirty": dirty,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {
+                "seed": args.seed,
+                "employees": args.employees,
+                "days": args.days,
+                "attendance_records": record_count,
+                "pending_leaves": plan.pending_leaves,
+                "concurrency": args.concurrency,
+                "repeat": args.repeat,
+                "cursor_pages": args.cursor_pages,
+                "rollups": not args.skip_rollups,
+            },
+        },
+        "scenarios": results,
+    }
+
+    path = args.output
+    if not path:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{stamp}-{(commit or 'nogit')[:10]}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+    print(f"\nresults written to {path}")
+
+    if args.compare:
+        compare(args.compare, output)
+
+    api.shutdown_db()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="In-process benchmark for the attendance API")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--employees", type=int, default=300)
+    parser.add_argument("--days", type=int, default=120, help="calendar days of seeded history ending yesterday")
+    parser.add_argument("--pending-leaves", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions of each read scenario's request set")
+    parser.add_argument("--cursor-pages", type=int, default=200)
+    parser.add_argument("--scenarios", help="comma-separated subset of scenarios")
+    parser.add_argument("--skip-rollups", action="store_true", help="do not build rollups (reports use raw scans)")
+    parser.add_argument("--output", help="result JSON path (default bench_results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="previous result JSON to diff against")
+    parser.add_argument("--list", action="store_true", help="list scenarios and exit")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.list:
+        print("\n".join(SCENARIOS))
+    else:
+        asyncio.run(main(arguments))
@@ -1,65 +1,274 @@
 """
 clear_data.py
 
-Safe helper to clear attendance database collections.
+Data purge and retention tool for the attendance database.
 
 Usage:
-  python clear_data.py
+  python clear_data.py --dry-run --before 2023-01-01                 # count only
+  python clear_data.py --before 2023-01-01 --yes                     # retention purge of attendance
+  python clear_data.py --older-than-days 1095 --window 20:00-06:00 --yes
+  python clear_data.py --collection attendance --collection leaves --department Sales --from 2024-01-01 --to 2024-06-30
+  python clear_data.py --collection all --drop                       # wipe everything, recreate indexes
 
-This script will print current document counts for `employees`,
-`attendance_records`, and `leave_requests`, then ask for confirmation.
-Type exactly "YES" to proceed with deletion.
+Collections (--collection, repeatable, default attendance):
+  attendance   attendance_records, filtered by `date` and/or the employee's department
+  leaves       leave_requests, filtered by start_date/end_date and/or department
+  employees    employees, filtered by department only
+  archive      attendance_archive (archived months, see archive_attendance.py), filtered by
+               whole months and/or department
+  rollups      attendance_rollups (derived data; whole collection only)
+  all          all of the above
+
+Filtered purges delete in batches of --batch-size documents (each batch is
+looked up through an index and removed with one delete_many by _id), sleep
+--pause seconds between batches, and with --window only run inside the given
+time-of-day window, so a multi-million-record purge never holds the database
+for long. Deleted attendance records (hot or archived) are subtracted from
+the rollups as they go, keeping reports consistent.
+
+--drop is the fast path for whole collections: it drops them and recreates
+their indexes (and an empty rollup marker) instead of deleting document by
+document. It cannot be combined with filters.
+
+Counts are printed first; type YES to proceed, or pass --yes to skip the
+prompt (for cron jobs). --dry-run only prints the counts.
 """
-import os
+import argparse
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
-from beanie import init_beanie
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Optional
+
+from attendance_system.models import Employee, AttendanceRecord, LeaveRequest, AttendanceRollup, AttendanceArchive
+from attendance_system import archive, database, rollups
+from attendance_system.utils import day_start
+COLLECTIONS = {
+    "attendance": AttendanceRecord,
+    "leaves": LeaveRequest,
+    "employees": Employee,
+    "archive": AttendanceArchive,
+    "rollups": AttendanceRollup,
+}
+# 批量删除时按这个顺序查找，能走对应的索引，删掉的文档不会再被扫到
+BATCH_SORT = {
+    "attendance": [("date", 1), ("_id", 1)],
+    "leaves": [("_id", 1)],
+    "employees": [("_id", 1)],
+    "archive": [("month", 1), ("employee_id", 1)],
+    "rollups": [("_id", 1)],
+}
+RECORD_FIELDS = {"employee_id": 1, "date": 1, "status": 1, "check_in_time": 1, "check_out_time": 1}
+
+
+def parse_window(value: str):
+    try:
+        start, end = value.split("-")
+        return dtime.fromisoformat(start), dtime.fromisoformat(end)
+    except ValueError:
+        raise argparse.ArgumentTypeError("window must look like 20:00-06:00")
+
+
+def in_window(window, now: datetime) -> bool:
+    if window is None:
+        return True
+    start, end = window
+    current = now.time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end  # 跨午夜
+
+
+async def wait_for_window(window):
+    announced = False
+    while not in_window(window, datetime.now()):
+        if not announced:
+            print(f"  outside window {window[0]:%H:%M}-{window[1]:%H:%M}, waiting...")
+            announced = True
+        await asyncio.sleep(60)
 
-from attendance_system.models import Employee, AttendanceRecord, LeaveRequest
 
+async def department_employee_ids(department: str) -> list:
+    cursor = Employee.get_motor_collection().find({"department": department}, {"_id": 1})
+    return [doc["_id"] async for doc in cursor]
 
-async def clear_all(mongodb_url: str):
-    client = AsyncIOMotorClient(mongodb_url)
-    db = client.attendance_db
 
-    # initialize Beanie so models are registered (some codepaths expect this)
-    await init_beanie(database=db, document_models=[Employee, AttendanceRecord, LeaveRequest])
+async def build_filter(name: str, args) -> dict:
+    date_from = args.date_from
+    before = args.before
+    if args.date_to is not None:
+        end = args.date_to + timedelta(days=1)
+        before = end if before is None else min(before, end)
 
-    emp_col = db.get_collection("employees")
-    att_col = db.get_collection("attendance_records")
-    leave_col = db.get_collection("leave_requests")
+    query = {}
+    if name == "attendance":
+        if date_from is not None or before is not None:
+            query["date"] = {}
+            if date_from is not None:
+                query["date"]["$gte"] = day_start(date_from)
+            if before is not None:
+                query["date"]["$lt"] = day_start(before)
+    elif name == "leaves":
+        # 整张请假单都落在区间内才删除
+        if date_from is not None:
+            query["start_date"] = {"$gte": day_start(date_from)}
+        if before is not None:
+            query["end_date"] = {"$lt": day_start(before)}
+    elif name == "archive":
+        # 归档按整月存放，只删除整月都在区间内的
+        if date_from is not None or before is not None:
+            query["month"] = {}
+            if date_from is not None:
+                first = date_from if date_from.day == 1 else archive.month_bounds(archive.month_key(date_from))[1]
+                query["month"]["$gte"] = archive.month_key(first)
+            if before is not None:
+                query["month"]["$lt"] = archive.month_key(before)
+    elif name == "employees":
+        if date_from is not None or before is not None:
+            sys.exit("employees can only be filtered by --department")
+    elif name == "rollups":
+        if date_from is not None or before is not None or args.department:
+            sys.exit("rollups can only be purged as a whole (rebuild them with rebuild_rollups.py instead)")
 
-    emp_count = await emp_col.count_documents({})
-    att_count = await att_col.count_documents({})
-    leave_count = await leave_col.count_documents({})
+    if args.department:
+        if name == "employees":
+            query["department"] = args.department
+        elif name in ("attendance", "leaves", "archive"):
+            query["employee_id"] = {"$in": await department_employee_ids(args.department)}
+    return query
 
-    print("Current counts:")
-    print(f"  employees: {emp_count}")
-    print(f"  attendance_records: {att_count}")
-    print(f"  leave_requests: {leave_count}")
 
-    confirm = input('\nType YES to delete ALL documents in these collections: ')
-    if confirm != 'YES':
-        print('Aborted. No changes made.')
-        client.close()
+async def purge_batched(name: str, query: dict, args, departments: Optional[dict]) -> int:
+    collection = COLLECTIONS[name].get_motor_collection()
+    projection = RECORD_FIELDS if name == "attendance" else archive.ARCHIVE_FIELDS if name == "archive" else {"_id": 1}
+    deleted = 0
+    started = time.perf_counter()
+    while True:
+        await wait_for_window(args.window)
+        docs = await collection.find(query, projection).sort(BATCH_SORT[name]).limit(args.batch_size).to_list(length=args.batch_size)
+        if not docs:
+            break
+        result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        deleted += result.deleted_count
+        if name in ("attendance", "archive") and departments is not None:
+            # 从 rollup 中减掉被删除记录的计数
+            removed = docs if name == "attendance" else [row for doc in docs for row in archive.decode_month(doc)]
+            await rollups.apply_changes(
+                (rollups.RawRecord(doc), None, departments.get(doc["employee_id"])) for doc in removed
+            )
+        elapsed = time.perf_counter() - started
+        print(f"  {name}: {deleted} deleted ({deleted / elapsed if elapsed else 0:,.0f} docs/s)")
+        if len(docs) < args.batch_size:
+            break
+        if args.pause:
+            await asyncio.sleep(args.pause)
+    return deleted
+
+
+async def main(args):
+    # initialize Beanie so models are registered and indexes exist
+    db = await database.connect(minPoolSize=0)
+
+    names = list(COLLECTIONS) if "all" in args.collection else list(dict.fromkeys(args.collection))
+    filtered = args.before is not None or args.date_from is not None or args.date_to is not None or args.department
+    if args.drop and filtered:
+        sys.exit("--drop removes whole collections and cannot be combined with --before/--from/--to/--department")
+
+    queries = {name: await build_filter(name, args) for name in names}
+    print(f"Database: {db.name}")
+    print("Documents matched:" if filtered else "Current counts:")
+    counts = {}
+    for name in names:
+        collection = COLLECTIONS[name].get_motor_collection()
+        if queries[name]:
+            counts[name] = await collection.count_documents(queries[name])
+        else:
+            counts[name] = await collection.estimated_document_count()
+        print(f"  {COLLECTIONS[name].get_settings().name}: {counts[name]}")
+
+    if args.dry_run:
+        print("\nDry run. No changes made.")
+        database.close()
         return
 
-    # perform deletions
-    emp_res = await emp_col.delete_many({})
-    att_res = await att_col.delete_many({})
-    leave_res = await leave_col.delete_many({})
+    if not args.yes:
+        action = "DROP these collections" if args.drop else "delete the matched documents"
+        confirm = input(f"\nType YES to {action}: ")
+        if confirm != 'YES':
+            print('Aborted. No changes made.')
+            database.close()
+            return
+
+    if args.drop:
+        for name in names:
+            await COLLECTIONS[name].get_motor_collection().drop()
+            print(f"  dropped {COLLECTIONS[name].get_settings().name}")
+        if ("attendance" in names or "archive" in names) and "rollups" not in names:
+            # rollup 由考勤记录派生，一起清空
+            await AttendanceRollup.get_motor_collection().drop()
+            print("  dropped attendance_rollups (derived from attendance_records)")
+        # 重新建索引；rollup 重建在空集合上只写入完成标记
+        await database.init_models(db)
+        if "attendance" in names or "archive" in names or "rollups" in names:
+            await rollups.rebuild_rollups()
+        print("Indexes recreated.")
+        database.close()
+        return
+
+    # 同时清空 rollup 时不需要再逐条扣减
+    departments = None
+    if ("attendance" in names or "archive" in names) and "rollups" not in names:
+        departments = {}
+        async for emp in Employee.get_motor_collection().find({}, {"department": 1}):
+            departments[emp["_id"]] = emp.get("department")
+
+    if "rollups" in names:
+        # 先删完成标记，清空过程中报表就回退到原始记录
+        await rollups.invalidate()
 
     print('\nDeletion results:')
-    print(f"  employees deleted: {getattr(emp_res, 'deleted_count', 'unknown')}")
-    print(f"  attendance_records deleted: {getattr(att_res, 'deleted_count', 'unknown')}")
-    print(f"  leave_requests deleted: {getattr(leave_res, 'deleted_count', 'unknown')}")
+    for name in names:
+        if not counts[name]:
+            print(f"  {COLLECTIONS[name].get_settings().name} deleted: 0")
+            continue
+        deleted = await purge_batched(name, queries[name], args, departments)
+        print(f"  {COLLECTIONS[name].get_settings().name} deleted: {deleted}")
+    if "employees" in names and "attendance" not in names:
+        print("Note: attendance records and leaves of deleted employees are kept; purge them separately if needed.")
+    if "rollups" in names:
+        print("Rollups were cleared; run `python rebuild_rollups.py` to rebuild them "
+              "(the monthly summary scans raw records until then).")
+
+    database.close()
+
 
-    client.close()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Purge attendance data by collection, date range or department")
+    parser.add_argument("--collection", action="append", choices=list(COLLECTIONS) + ["all"],
+                        help="collection to purge (repeatable, default attendance)")
+    parser.add_argument("--before", type=date.fromisoformat, help="delete data dated before this day (YYYY-MM-DD)")
+    parser.add_argument("--older-than-days", type=int, help="shorthand for --before today minus N days")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="range start, inclusive")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="range end, inclusive")
+    parser.add_argument("--department", help="only data of employees in this department")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.1, help="seconds to sleep between batches")
+    parser.add_argument("--window", type=parse_window, help="only delete during this time of day, e.g. 20:00-06:00")
+    parser.add_argument("--drop", action="store_true", help="drop whole collections and recreate indexes")
+    parser.add_argument("--dry-run", action="store_true", help="print matched counts and exit")
+    parser.add_argument("--yes", action="store_true", help="do not ask for confirmation")
+    args = parser.parse_args()
+    args.collection = args.collection or ["attendance"]
+    if args.older_than_days is not None:
+        cutoff = date.today() - timedelta(days=args.older_than_days)
+        args.before = cutoff if args.before is None else min(args.before, cutoff)
+    if args.batch_size < 1:
+        sys.exit("--batch-size must be positive")
+    return args
 
 
 if __name__ == '__main__':
-    mongodb_url = os.getenv('MONGODB_URL', 'mongodb://localhost:27017/attendance_db')
     try:
-        asyncio.run(clear_all(mongodb_url))
+        asyncio.run(main(parse_args()))
     except KeyboardInterrupt:
-        print('\nInterrupted by user.')
\ No newline at end of file
+        print('\nInterrupted by user.')
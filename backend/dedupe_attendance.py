@@ -0,0 +1,170 @@
+"""
+dedupe_attendance.py
+
+One-time migration that merges duplicate same-day attendance records and checks
+employee codes before the unique indexes are built.
+
+Usage:
+  python dedupe_attendance.py            # merge duplicates, then build indexes
+  python dedupe_attendance.py --dry-run  # only report what would change
+
+`AttendanceRecord` now declares a unique `(employee_id, date)` index. MongoDB
+refuses to build it while duplicates exist, so run this script once before
+starting the API on an existing database.
+
+For every `(employee_id, date)` group with more than one record the script keeps
+the record with the earliest check-in (falling back to ON_LEAVE, then to the
+oldest record), merges the latest check-out and any notes into it, recomputes
+working hours/status and deletes the rest.
+
+`Employee.employee_code` is unique as well, compared in its normal form
+(EMP0001 and EMP001 are the same code). Codes stored in another form are
+rewritten to the normal form. Employees sharing a code are not merged
+automatically (attendance and leave point at them by id); the script lists
+them and skips building indexes until they have been renamed or removed.
+It also drops the old single-field `date` index, which the `(date, status)` and
+`(date, _id)` indexes now cover.
+"""
+import argparse
+import asyncio
+import sys
+
+from attendance_system import database
+from attendance_system.enums import AttendanceStatus
+from attendance_system.models import normalize_employee_code
+from attendance_system.utils import calculate_working_hours, determine_status
+
+
+def _rank(doc: dict) -> tuple:
+    """排序键：有签到的优先（签到越早越优先），其次是请假记录，最后按插入顺序"""
+    if doc.get("check_in_time"):
+        return (0, doc["check_in_time"], doc["_id"])
+    if doc.get("status") == AttendanceStatus.ON_LEAVE.value:
+        return (1, None, doc["_id"])
+    return (2, None, doc["_id"])
+
+
+def merge_duplicates(docs: list) -> tuple:
+    """返回 (保留记录的 $set 字段, 保留记录 _id, 待删除 _id 列表)"""
+    docs = sorted(docs, key=_rank)
+    keeper, others = docs[0], docs[1:]
+
+    update = {}
+    check_outs = [d["check_out_time"] for d in docs if d.get("check_out_time")]
+    if keeper.get("check_in_time") and check_outs:
+        check_out = max(check_outs)
+        if check_out > keeper["check_in_time"] and check_out != keeper.get("check_out_time"):
+            hours = calculate_working_hours(keeper["check_in_time"], check_out)
+            update["check_out_time"] = check_out
+            update["working_hours"] = hours
+            update["status"] = determine_status(keeper["check_in_time"], hours).value
+
+    notes = []
+    for d in docs:
+        if d.get("notes") and d["notes"] not in notes:
+            notes.append(d["notes"])
+    merged_notes = "; ".join(notes)[:200] if notes else None
+    if merged_notes != keeper.get("notes"):
+        update["notes"] = merged_notes
+
+    return update, keeper["_id"], [d["_id"] for d in others]
+
+
+async def check_employee_codes(db) -> tuple:
+    """按规范写法分组员工编号
+
+    返回 (重复组 [{"_id": 规范编号, "employees": [...]}], 需要改写的 [(员工 _id, 原编号, 规范编号)])；
+    重复组里的员工不改写，留给人工处理。
+    """
+    groups = {}
+    projection = {"employee_code": 1, "full_name": 1, "is_deactivated": 1}
+    async for emp in db.get_collection("employees").find({}, projection):
+        groups.setdefault(normalize_employee_code(emp["employee_code"]), []).append(emp)
+    duplicates = [
+        {"_id": code, "employees": sorted(employees, key=lambda emp: emp["_id"])}
+        for code, employees in sorted(groups.items()) if len(employees) > 1
+    ]
+    renames = [
+        (employees[0]["_id"], employees[0]["employee_code"], code)
+        for code, employees in sorted(groups.items())
+        if len(employees) == 1 and employees[0]["employee_code"] != code
+    ]
+    return duplicates, renames
+
+
+async def dedupe(mongodb_url: str, dry_run: bool = False):
+    # 注意：这里不能先 init_beanie，否则唯一索引会在清理前创建失败
+    db = await database.connect(mongodb_url, init=False, minPoolSize=0)
+    att_col = db.get_collection("attendance_records")
+
+    pipeline = [
+        {"$group": {
+            "_id": {"employee_id": "$employee_id", "date": "$date"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+
+    groups = 0
+    merged = 0
+    removed = 0
+    async for group in att_col.aggregate(pipeline, allowDiskUse=True):
+        docs = await att_col.find({"_id": {"$in": group["ids"]}}).to_list(length=None)
+        update, keeper_id, delete_ids = merge_duplicates(docs)
+        groups += 1
+        merged += 1 if update else 0
+        removed += len(delete_ids)
+        if dry_run:
+            continue
+        if update:
+            await att_col.update_one({"_id": keeper_id}, {"$set": update})
+        await att_col.delete_many({"_id": {"$in": delete_ids}})
+
+    print(f"duplicate groups: {groups}")
+    print(f"  records updated: {merged}")
+    print(f"  records {'to delete' if dry_run else 'deleted'}: {removed}")
+
+    duplicate_codes, renames = await check_employee_codes(db)
+    print(f"employee codes {'to normalize' if dry_run else 'normalized'}: {len(renames)}")
+    for employee_id, old, new in renames:
+        print(f"  {employee_id}: {old} -> {new}")
+        if not dry_run:
+            await db.get_collection("employees").update_one({"_id": employee_id}, {"$set": {"employee_code": new}})
+    print(f"duplicate employee codes: {len(duplicate_codes)}")
+    for group in duplicate_codes:
+        employees = ", ".join(
+            f"{emp['_id']} ({emp['employee_code']}, {emp.get('full_name')}{', deactivated' if emp.get('is_deactivated') else ''})"
+            for emp in group["employees"]
+        )
+        print(f"  {group['_id']}: {employees}")
+
+    legacy_index = "date_1" in await att_col.index_information()
+    if legacy_index:
+        print(f"legacy attendance_records index date_1: {'to drop' if dry_run else 'dropped'}")
+
+    if dry_run:
+        print("Dry run, no changes made.")
+    elif duplicate_codes:
+        print("Indexes not created: give each employee above a unique code (or delete the extras), then run again.")
+    else:
+        if legacy_index:
+            await att_col.drop_index("date_1")
+        # 清理完成后再让 Beanie 创建（唯一）索引
+        await database.init_models(db)
+        print("Indexes created.")
+
+    database.close()
+    return not duplicate_codes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge duplicate same-day attendance records")
+    parser.add_argument("--dry-run", action="store_true", help="report duplicates without changing anything")
+    args = parser.parse_args()
+    try:
+        ok = asyncio.run(dedupe(database.MONGODB_URL, dry_run=args.dry_run))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user.")
+        sys.exit(130)
+    sys.exit(0 if ok else 1)
@@ -1,20 +1,48 @@
-import asyncio
-import os
-from datetime import date, timedelta
-from random import choice, randint
-from typing import List
+"""
+generate_data.py
+
+Deterministic synthetic data for local development and benchmarking.
+
+Usage:
+  python generate_data.py                                   # 30 employees, 1 year
+  python generate_data.py --employees 20000 --years 3 --drop
+  python generate_data.py --seed 7 --end 2025-12-31 --batch-size 10000 --concurrency 8
 
-from motor.motor_asyncio import AsyncIOMotorClient
-from beanie import init_beanie
+The same --seed and date range always produce the same documents (including
+ObjectIds), so datasets can be regenerated identically on another machine.
+
+Every employee gets a punctuality profile (mean arrival time and spread, so
+some are habitually late), an absence rate and a half-day rate. History runs
+on working days (see PUBLIC_HOLIDAYS) from the later of the hire date and --years before --end, and
+stops at deactivation for the few employees that leave. Each year also has
+approved annual and sick leave (stored as "On Leave" records, exactly like
+approve_leave writes them), some rejected requests and a few pending ones
+in the next month.
+
+Documents are written with unordered insert_many in batches of --batch-size,
+with up to --concurrency batches in flight. Rollups are rebuilt at the end
+unless --skip-rollups is given. The employees collection must be empty, or
+pass --drop to clear employees, attendance, leaves and rollups first.
+"""
+import argparse
+import asyncio
+import bisect
+import calendar
+import random
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
 
-from attendance_system.models import Employee, EmployeeCreate, LeaveRequest, LeaveCreate, AttendanceRecord
-from attendance_system.enums import Department, LeaveType
-from attendance_system.utils import calculate_leave_days
+from bson import ObjectId
 
-# MongoDB URL
-MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/attendance_db")
+from attendance_system.models import Employee, LeaveRequest, AttendanceRecord
+from attendance_system.enums import Department, AttendanceStatus, LeaveType
+from attendance_system import database
+from attendance_system.rollups import rebuild_rollups
+from attendance_system.utils import calculate_leave_days, calculate_working_hours, day_start, determine_status
+from attendance_system.workdays import business_calendar
 
-# 名字列表（15 个，30 个员工重复使用）
+# 名字列表，和编号组合成全名
 NAMES = [
     "one", "two", "three", "four", "five",
     "six", "seven", "eight", "nine", "ten",
@@ -25,89 +53,308 @@ POSITIONS = ["Developer", "Designer", "Manager", "Analyst", "Tester", "HR", "Sal
 
 REASONS = ["生病需要休息", "家庭事务", "年假", "个人原因", "参加婚礼", "旅游", "身体不适", "照顾家人"]
 
-async def main():
+# 部门规模权重（运营和销售人最多）
+DEPARTMENT_WEIGHTS = {
+    Department.HR: 1,
+    Department.IT: 3,
+    Department.FINANCE: 1,
+    Department.OPERATIONS: 4,
+    Department.SALES: 3,
+    Department.MARKETING: 2,
+}
+
+# ObjectId 的类型字节，配合计数器保证唯一
+KIND_EMPLOYEE, KIND_RECORD, KIND_LEAVE = 1, 2, 3
+
+PROGRESS_EVERY = 1000  # 每生成多少个员工打印一次进度
+
+
+def make_id(when: datetime, kind: int, n: int) -> ObjectId:
+    """确定性的 ObjectId：时间部分取文档自身的时间，_id 顺序与日期一致"""
+    return ObjectId(f"{calendar.timegm(when.timetuple()) & 0xFFFFFFFF:08x}{kind:02x}{n:014x}")
+
+
+class BatchWriter:
+    """按集合缓冲文档，满 batch_size 就提交一次 insert_many；最多 concurrency 个批次同时写"""
+
+    def __init__(self, db, batch_size: int, concurrency: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.buffers = {}
+        self.written = {}
+        self.tasks = set()
+        self.started = time.perf_counter()
+
+    async def add(self, collection: str, doc: dict):
+        buffer = self.buffers.setdefault(collection, [])
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            await self.flush(collection)
+
+    async def flush(self, collection: str):
+        docs = self.buffers.pop(collection, None)
+        if not docs:
+            return
+        # 并发批次已满时在这里等待，生成速度不会把内存撑爆
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self._insert(collection, docs))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _insert(self, collection: str, docs: list):
+        try:
+            await self.db[collection].insert_many(docs, ordered=False)
+            self.written[collection] = self.written.get(collection, 0) + len(docs)
+        finally:
+            self.semaphore.release()
+
+    async def close(self):
+        for collection in list(self.buffers):
+            await self.flush(collection)
+        if self.tasks:
+            await asyncio.gather(*list(self.tasks))
+
+    @property
+    def total(self) -> int:
+        return sum(self.written.values())
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.total / elapsed if elapsed > 0 else 0.0
+
+
+class Generator:
+    def __init__(self, seed: int, start: date, end: date):
+        self.rng = random.Random(seed)
+        self.start = start
+        self.end = end
+        self.workdays = business_calendar.working_days(start, end)
+        self.departments = list(DEPARTMENT_WEIGHTS)
+        self.weights = list(DEPARTMENT_WEIGHTS.values())
+        self.record_seq = 0
+        self.leave_seq = 0
+        self.status_counts = {}
+
+    def employee(self, i: int) -> dict:
+        rng = self.rng
+        # 约 30% 在数据起始日前入职，其余在区间内陆续入职
+        if rng.random() < 0.3:
+            hire_date = self.start - timedelta(days=rng.randint(1, 3 * 365))
+        else:
+            hire_date = self.start + timedelta(days=rng.randint(0, max(0, (self.end - self.start).days - 30)))
+        name = NAMES[(i - 1) % len(NAMES)].capitalize()
+        created_at = datetime.combine(hire_date, dtime(9, 0))
+        doc = {
+            "_id": make_id(created_at, KIND_EMPLOYEE, i),
+            "employee_code": f"EMP{i:03d}",
+            "full_name": f"{name} {i}",
+            "email": f"{name.lower()}{i}@company.com",
+            "department": rng.choices(self.departments, self.weights)[0].value,
+            "position": rng.choice(POSITIONS),
+            "hire_date": day_start(hire_date),
+            "is_deactivated": False,
+            "created_at": created_at,
+        }
+        # 约 4% 的员工已离职：离职日之后没有记录
+        last_day = self.end
+        if rng.random() < 0.04 and hire_date < self.end:
+            last_day = hire_date + timedelta(days=rng.randint(0, (self.end - hire_date).days))
+            doc["is_deactivated"] = True
+        return doc, max(hire_date, self.start), last_day
+
+    def leaves(self, employee_id: ObjectId, days: list):
+        """按年生成请假；返回 (请假单文档, 已批准的请假日集合)"""
+        rng = self.rng
+        docs = []
+        on_leave = set()
+        if not days:
+            return docs, on_leave
+        for year in range(days[0].year, days[-1].year + 1):
+            lo = bisect.bisect_left(days, date(year, 1, 1))
+            hi = bisect.bisect_right(days, date(year, 12, 31))
+            if hi - lo < 5:
+                continue
+            plan = [(LeaveType.ANNUAL_LEAVE, rng.randint(1, 5)) for _ in range(rng.randint(1, 4))]
+            plan += [(LeaveType.SICK_LEAVE, rng.randint(1, 2)) for _ in range(rng.randint(0, 3))]
+            if rng.random() < 0.1:
+                plan.append((rng.choice([LeaveType.PERSONAL_LEAVE, LeaveType.UNPAID_LEAVE]), rng.randint(1, 3)))
+            for leave_type, length in plan:
+                first = rng.randint(lo, hi - 1)
+                span = days[first:min(first + length, hi)]
+                if any(d in on_leave for d in span):
+                    continue
+                status = "Rejected" if rng.random() < 0.08 else "Approved"
+                docs.append(self.leave_doc(employee_id, leave_type, span[0], span[-1], status))
+                if status == "Approved":
+                    on_leave.update(span)
+        return docs, on_leave
+
+    def leave_doc(self, employee_id: ObjectId, leave_type: LeaveType, start: date, end: date, status: str) -> dict:
+        rng = self.rng
+        self.leave_seq += 1
+        requested_at = datetime.combine(start - timedelta(days=rng.randint(1, 14)), dtime(10, rng.randint(0, 59)))
+        approved = status == "Approved"  # 驳回时接口不记录审批人
+        return {
+            "_id": make_id(requested_at, KIND_LEAVE, self.leave_seq),
+            "employee_id": employee_id,
+            "leave_type": leave_type.value,
+            "start_date": day_start(start),
+            "end_date": day_start(end),
+            "total_days": calculate_leave_days(start, end),
+            "reason": rng.choice(REASONS),
+            "status": status,
+            "requested_at": requested_at,
+            "approved_by": rng.randint(1, 20) if approved else None,
+            "approved_at": requested_at + timedelta(days=1) if approved else None,
+        }
+
+    def records(self, employee_id: ObjectId, days: list, on_leave: set):
+        rng = self.rng
+        # 员工的出勤画像：平均到达时间（相对 9:00，分钟）和波动、缺勤率、半天率
+        arrival_mean = rng.gauss(-12, 10)
+        arrival_spread = rng.uniform(3, 15)
+        absence_rate = rng.uniform(0.003, 0.03)
+        half_day_rate = rng.uniform(0.005, 0.03)
+        day_hours = rng.uniform(8.5, 9.5)
+
+        for d in days:
+            self.record_seq += 1
+            midnight = day_start(d)
+            doc = {
+                "_id": make_id(midnight, KIND_RECORD, self.record_seq),
+                "employee_id": employee_id,
+                "date": midnight,
+                "check_in_time": None,
+                "check_out_time": None,
+                "working_hours": None,
+                "notes": None,
+            }
+            if d in on_leave:
+                doc["status"] = AttendanceStatus.ON_LEAVE.value
+            elif rng.random() < absence_rate:
+                doc["status"] = AttendanceStatus.ABSENT.value
+            else:
+                offset = min(max(rng.gauss(arrival_mean, arrival_spread), -90), 150)
+                check_in = midnight + timedelta(hours=9, minutes=offset)
+                if rng.random() < half_day_rate:
+                    hours = rng.uniform(2.5, 3.9)
+                else:
+                    hours = rng.gauss(day_hours, 0.4)
+                check_out = check_in + timedelta(hours=hours)
+                working_hours = calculate_working_hours(check_in, check_out)
+                doc["check_in_time"] = check_in.replace(microsecond=0)
+                doc["check_out_time"] = check_out.replace(microsecond=0)
+                doc["working_hours"] = working_hours
+                doc["status"] = determine_status(check_in, working_hours).value
+            self.status_counts[doc["status"]] = self.status_counts.get(doc["status"], 0) + 1
+            yield doc
+
+    def pending_leave(self, employee_id: ObjectId):
+        """约 5% 的员工有下个月内的待审批请假"""
+        rng = self.rng
+        if rng.random() >= 0.05:
+            return None
+        start = business_calendar.next_working_day(self.end + timedelta(days=rng.randint(1, 30)))
+        return self.leave_doc(employee_id, rng.choice(list(LeaveType)), start, start + timedelta(days=rng.randint(0, 4)), "Pending")
+
+
+async def generate(args, db):
+    end = args.end
+    start = end - timedelta(days=int(args.years * 365) - 1)
+    generator = Generator(args.seed, start, end)
+    writer = BatchWriter(db, args.batch_size, args.concurrency)
+
+    employees = Employee.get_settings().name
+    records = AttendanceRecord.get_settings().name
+    leaves = LeaveRequest.get_settings().name
+
+    print(f"generating {args.employees} employees, {start} .. {end} (seed {args.seed})")
+    for i in range(1, args.employees + 1):
+        employee, first_day, last_day = generator.employee(i)
+        await writer.add(employees, employee)
+
+        lo = bisect.bisect_left(generator.workdays, first_day)
+        hi = bisect.bisect_right(generator.workdays, last_day)
+        days = generator.workdays[lo:hi]
+        leave_docs, on_leave = generator.leaves(employee["_id"], days)
+        if not employee["is_deactivated"]:
+            pending = generator.pending_leave(employee["_id"])
+            if pending is not None:
+                leave_docs.append(pending)
+        for doc in leave_docs:
+            await writer.add(leaves, doc)
+        for doc in generator.records(employee["_id"], days, on_leave):
+            await writer.add(records, doc)
+
+        if i % PROGRESS_EVERY == 0:
+            print(f"  {i} employees, {writer.total} documents written ({writer.rate():,.0f} docs/s)")
+
+    await writer.close()
+    elapsed = time.perf_counter() - writer.started
+    for name, count in sorted(writer.written.items()):
+        print(f"{name}: {count}")
+    print("attendance by status: " + ", ".join(f"{status}={count}" for status, count in sorted(generator.status_counts.items())))
+    print(f"{writer.total} documents in {elapsed:.1f}s ({writer.rate():,.0f} docs/s)")
+
+
+async def main(args):
     print("connecting MongoDB...")
     try:
-        client = AsyncIOMotorClient(MONGODB_URL, serverSelectionTimeoutMS=5000)
-        await client.server_info()
+        # 连接数跟写入并发走
+        db = await database.connect(init=False, minPoolSize=0, maxPoolSize=max(args.concurrency * 2, 10))
         print("MongoDB connected!")
     except Exception as e:
         print(f"connection failed: {e}")
         return
 
-    db_name = MONGODB_URL.split("/")[-1].split("?")[0] or "attendance_db"
-    db = client[db_name]
+    if args.drop:
+        for model in database.DOCUMENT_MODELS:
+            await db.drop_collection(model.get_settings().name)
+        print("existing employees, attendance, leaves and rollups dropped")
 
     print("Initializing Beanie...")
     try:
-        await init_beanie(
-            database=db,
-            document_models=[Employee, AttendanceRecord, LeaveRequest]
-        )
+        await database.init_models(db)
         print("Beanie successfully initialized!")
     except Exception as e:
         print(f"Beanie initialization failed: {e}")
+        database.close()
         return
 
-    print("start generating data...")
+    if await Employee.get_motor_collection().estimated_document_count():
+        print("employees collection is not empty; rerun with --drop to replace the existing data")
+        database.close()
+        return
 
-    for i in range(1, 11):
-        emp_code = f"EMP{i:03d}"
-        name = NAMES[(i - 1) % len(NAMES)].capitalize()
-        email = f"{name.lower()}{i}@company.com"
-        department = choice(list(Department))
-        position = choice(POSITIONS)
-        hire_date = date(2024, randint(1, 12), randint(1, 28))
-
-        # 检查是否已存在
-        existing = await Employee.find_one({"employee_code": emp_code})
-        if existing:
-            print(f"{emp_code} exits, skipping")
-            employee = existing
-        else:
-            emp_data = EmployeeCreate(
-                employee_code=emp_code,
-                full_name=name,
-                email=email,
-                department=department,
-                position=position,
-                hire_date=hire_date
-            )
-            employee = Employee(**emp_data.model_dump())
-            await employee.insert()
-
-        # 前 10 个员工生成 1-3 条请假记录
-        if i <= 10:
-            num_leaves = randint(1, 3)
-            for _ in range(num_leaves):
-                leave_type = choice(list(LeaveType))
-                days_ago = randint(0, 60)
-                start_date = date.today() - timedelta(days=days_ago)
-                duration = randint(1, 5)
-                end_date = start_date + timedelta(days=duration - 1)
-
-                existing_leave = await LeaveRequest.find_one({
-                    "employee_id": employee.id,
-                    "start_date": start_date,
-                    "end_date": end_date
-                })
-                if existing_leave:
-                    continue
+    await generate(args, db)
+
+    if not args.skip_rollups:
+        started = time.perf_counter()
+        written = await rebuild_rollups()
+        print(f"rollup documents written: {written} ({time.perf_counter() - started:.1f}s)")
+
+    database.close()
 
-                total_days = calculate_leave_days(start_date, end_date)
 
-                leave = LeaveRequest(
-                    employee_id=employee.id,
-                    leave_type=leave_type,
-                    start_date=start_date,
-                    end_date=end_date,
-                    total_days=total_days,
-                    reason=choice(REASONS),
-                    status="Pending"
-                )
-                await leave.insert()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate deterministic synthetic attendance data")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--employees", type=int, default=30)
+    parser.add_argument("--years", type=float, default=1, help="years of history ending at --end")
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today() - timedelta(days=1),
+                        help="last day of history, YYYY-MM-DD (default yesterday)")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=4, help="insert_many batches in flight")
+    parser.add_argument("--drop", action="store_true", help="drop existing employees/attendance/leaves/rollups first")
+    parser.add_argument("--skip-rollups", action="store_true")
+    args = parser.parse_args()
+    if not 1 <= args.employees <= 999999:
+        sys.exit("--employees must be between 1 and 999999 (employee codes are EMP001-EMP999999)")
+    if args.years <= 0 or args.batch_size < 1 or args.concurrency < 1:
+        sys.exit("--years, --batch-size and --concurrency must be positive")
+    return args
 
-    print("\n30 finidhed!")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(parse_args()))
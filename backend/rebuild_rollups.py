@@ -0,0 +1,32 @@
+"""
+rebuild_rollups.py
+
+Regenerate the `attendance_rollups` collection from `attendance_records`.
+
+Usage:
+  python rebuild_rollups.py
+
+Run it once after deploying the rollup feature (reports keep scanning raw
+records until the first rebuild finishes), and again after bulk imports,
+dedupe_attendance.py or any manual edit to attendance records. Incremental
+updates made while the rebuild runs are overwritten, so run it off-peak.
+"""
+import asyncio
+import time
+
+from attendance_system import database
+from attendance_system.rollups import rebuild_rollups
+
+
+async def main():
+    await database.connect(minPoolSize=0)
+
+    started = time.perf_counter()
+    written = await rebuild_rollups()
+    print(f"rollup documents written: {written} ({time.perf_counter() - started:.1f}s)")
+
+    database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())